@@ -1,11 +1,38 @@
 from flask import Flask
-from extensions import jwt, cors, db, migrate
+from extensions import (
+    jwt,
+    cors,
+    db,
+    migrate,
+    cache,
+    query_stats,
+    metrics,
+    slow_queries,
+    profiler,
+)
 from config import config_obj
 from endpoints import AuthBlp, AccountBlp, CloudinaryBlp
+from commands import (
+    explain_lookups,
+    import_gedcom_command,
+    export_tree_command,
+    reindex_search_command,
+    backfill_name_keys_command,
+    slow_queries_command,
+    generate_tree_command,
+)
 from http_status import HttpStatus
 from status_res import StatusRes
 from utils import return_response
-from models import Member, ModSession, Spouse, OtherSpouse, Child, Moderators
+from models import (
+    Member,
+    ModSession,
+    Spouse,
+    OtherSpouse,
+    Child,
+    Moderators,
+    get_moderator_identity,
+)
 
 
 def create_app(config_name="development"):
@@ -16,6 +43,11 @@ def create_app(config_name="development"):
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
+    cache.init_app(app)
+    query_stats.init_app(app)
+    metrics.init_app(app)
+    slow_queries.init_app(app)
+    profiler.init_app(app)
     cors.init_app(
         app,
         resources={
@@ -58,7 +90,7 @@ def create_app(config_name="development"):
     @jwt.user_lookup_loader
     def user_lookup_callback(_jwt_header, jwt_data):
         user_id = jwt_data["sub"]
-        return Moderators.query.get(user_id)
+        return get_moderator_identity(user_id)
 
     @jwt.expired_token_loader
     def my_expired_token_callback(jwt_header, jwt_payload):
@@ -88,4 +120,12 @@ def create_app(config_name="development"):
     app.register_blueprint(AccountBlp, url_prefix="/api/v1")
     app.register_blueprint(CloudinaryBlp, url_prefix="/api/v1")
 
+    app.cli.add_command(explain_lookups)
+    app.cli.add_command(import_gedcom_command)
+    app.cli.add_command(export_tree_command)
+    app.cli.add_command(reindex_search_command)
+    app.cli.add_command(backfill_name_keys_command)
+    app.cli.add_command(slow_queries_command)
+    app.cli.add_command(generate_tree_command)
+
     return app
@@ -0,0 +1,72 @@
+import json
+import click
+from dotenv import load_dotenv
+from app_config import create_app
+from benchmarks import DEFAULT_REPEAT, DEFAULT_SIZES, run_benchmarks
+
+# Load environment variables
+load_dotenv()
+
+
+@click.command()
+@click.option(
+    "--sizes",
+    default=",".join(str(size) for size in DEFAULT_SIZES),
+    show_default=True,
+    help="Members in each seeded tree, comma separated.",
+)
+@click.option("--repeat", default=DEFAULT_REPEAT, show_default=True)
+@click.option("--seed", default=1, show_default=True)
+@click.option("--output", type=click.File("w"), help="Write the results as JSON.")
+def main(sizes, repeat, seed, output):
+    """Time the member endpoints against seeded trees and fail when one runs
+    more SQL statements than its budget or a hot lookup stops using its
+    index.
+
+    Runs against BENCHMARK_DATABASE_URL (an SQLite file in the temp
+    directory by default), which a second worker process reads as well.
+    That database is wiped, never point it at real data.
+    """
+    try:
+        sizes = [int(size) for size in sizes.split(",")]
+    except ValueError:
+        raise click.BadParameter("comma separated numbers", param_hint="--sizes")
+    app = create_app("benchmark")
+    results = []
+    unindexed = []
+    for members, seed_seconds, rows, plans in run_benchmarks(app, sizes, repeat, seed):
+        click.echo(f"\n{members} members (seeded in {seed_seconds:.1f} s)")
+        click.echo(
+            f"{'endpoint':<22}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"
+            f"{'queries':>9}{'budget':>8}"
+        )
+        for row in rows:
+            status = "ok" if row["ok"] else "FAIL"
+            if row["errors"]:
+                status += f" ({row['errors']} errors)"
+            click.echo(
+                f"{row['name']:<22}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+                f"{row['max_ms']:>9.1f}{row['queries']:>9}{row['budget']:>8}  "
+                f"{status}"
+            )
+        results.extend(rows)
+        for plan in plans:
+            if not plan["used"]:
+                click.echo(f"MISSING  {plan['name']}: expected {plan['index']}")
+                click.echo(f"    plan: {plan['plan']}")
+                unindexed.append(plan)
+    if output:
+        json.dump(results, output, indent=2)
+    failed = [row for row in results if not row["ok"]]
+    if failed:
+        raise click.ClickException(
+            f"{len(failed)} case(s) over their query budget or failing"
+        )
+    if unindexed:
+        raise click.ClickException(
+            f"{len(unindexed)} hot lookup(s) not using their index"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import contextlib
+import io
+import json
+import multiprocessing
+import time
+from flask_jwt_extended import create_access_token
+from app_config import create_app
+from extensions import db, cache, query_stats
+from models import (
+    Spouse,
+    create_mod,
+    create_member_with_spouse,
+    get_kinship_graph,
+)
+from synthetic import generate_tree
+from query_plans import check_lookups
+
+API = "/api/v1/account"
+DEFAULT_SIZES = (1000, 10000)
+DEFAULT_REPEAT = 20
+
+# most SQL statements one request may run, at any tree size. Reads are
+# measured with the caches cleared; "(warm)" rows repeat the request with
+# them filled, so a cache that stops working shows up as well. The write
+# cases always send the same family shape (see family). Reads include the
+# tree_change sync, writes the tree_change insert and, one time in
+# 1/TREE_CHANGE_PRUNE_RATE, its pruning. "(other worker)" reads a
+# member through a second process right after this one edited it
+QUERY_BUDGETS = {
+    "all-members": 4,
+    "all-members (cursor)": 3,
+    "member": 3,
+    "member (warm)": 1,
+    "fam-member": 6,
+    "fam-member (warm)": 1,
+    "member (other worker)": 3,
+    "create-member": 12,
+    "edit-member": 12,
+    "delete-member": 28,
+}
+
+
+def person(first_name, gender, **fields):
+    return {
+        "first_name": first_name,
+        "last_name": "Bench",
+        "gender": gender,
+        "dob": "1960-01-01",
+        "status": "Alive",
+        "img_str": "benchmark",
+        "birth_place": "Lagos",
+        "birth_name": f"{first_name} Bench",
+        **fields,
+    }
+
+
+# a husband with a wife, two children and an extra partner
+def family(i):
+    return person(
+        f"Husband{i}",
+        "Male",
+        spouse=person(f"Wife{i}", "Female"),
+        children=[
+            person(f"Son{i}", "Male", child_type="son"),
+            person(f"Daughter{i}", "Female", child_type="daughter"),
+        ],
+        other_spouses=[person(f"Partner{i}", "Female", relationship_type="wife")],
+    )
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# a second worker: its own process and app, so nothing in-process (kinship
+# graph, caches, tree_change cursor) is shared with the benchmark's app. It
+# answers (path, headers, endpoint) requests with (status, body, ms, queries)
+# until it receives None
+def serve_reads(connection):
+    app = create_app("benchmark")
+    client = app.test_client()
+    while True:
+        read = connection.recv()
+        if read is None:
+            break
+        path, headers, endpoint = read
+        query_stats.reset()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = client.get(path, headers=headers)
+        elapsed = (time.perf_counter() - started) * 1000
+        queries = query_stats.snapshot().get(endpoint, {}).get("max_queries", 0)
+        connection.send((response.status_code, response.get_json(), elapsed, queries))
+    connection.close()
+
+
+class Benchmark:
+    """Latency and SQL statement counts of the member endpoints against one
+    seeded tree.
+
+    Every case sends `repeat` requests through the test client and checks
+    the most statements any of them ran against QUERY_BUDGETS. Counts come
+    from the query_stats extension, so they are what Server-Timing reports.
+    """
+
+    def __init__(self, app, members, repeat=DEFAULT_REPEAT, seed=1):
+        self.app = app
+        self.members = members
+        self.repeat = repeat
+        self.seed = seed
+        self.client = app.test_client()
+
+    # wipes the database and fills it with a fresh tree
+    def seed_tree(self):
+        db.drop_all()
+        db.create_all()
+        mod = create_mod("bench@example.com", "benchmark", "Bench", "admin", True)
+        self.headers = {"Authorization": f"Bearer {create_access_token(mod.id)}"}
+        started = time.perf_counter()
+        generate_tree(self.members, seed=self.seed)
+        self.seed_seconds = time.perf_counter() - started
+        # the kinship graph is built once per process, not per request
+        get_kinship_graph(refresh=True)
+        # spouse ids are random, so this is a random sample of husbands
+        self.husbands = db.session.scalars(
+            db.select(Spouse.husband_id).order_by(Spouse.id).limit(self.repeat)
+        ).all()
+
+    def member_id(self, i):
+        return self.husbands[i % len(self.husbands)]
+
+    def request(self, method, path, body=None):
+        # the member endpoints print their payloads
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.client.open(
+                path, method=method, json=body, headers=self.headers
+            )
+
+    def measure(self, name, endpoint, request_for, warm=False):
+        timings = []
+        queries = []
+        errors = 0
+        for i in range(self.repeat):
+            method, path, body = request_for(i)
+            if warm:
+                self.request(method, path, body)
+            else:
+                cache.clear()
+            query_stats.reset()
+            started = time.perf_counter()
+            response = self.request(method, path, body)
+            timings.append((time.perf_counter() - started) * 1000)
+            errors += response.status_code != 200
+            queries.append(query_stats.snapshot()[endpoint]["max_queries"])
+        return self.result(name, timings, queries, errors)
+
+    def result(self, name, timings, queries, errors):
+        budget = QUERY_BUDGETS[name]
+        return {
+            "name": name,
+            "members": self.members,
+            "requests": self.repeat,
+            "errors": errors,
+            "p50_ms": round(percentile(timings, 0.5), 2),
+            "p95_ms": round(percentile(timings, 0.95), 2),
+            "max_ms": round(max(timings), 2),
+            "queries": max(queries),
+            "budget": budget,
+            "ok": not errors and max(queries) <= budget,
+        }
+
+    def all_members(self, i):
+        return "GET", f"{API}/all-members?page={i + 1}", None
+
+    def all_members_cursor(self, i):
+        return "GET", f"{API}/all-members?cursor=", None
+
+    def member(self, i):
+        return "GET", f"{API}/member/{self.member_id(i)}", None
+
+    def fam_member(self, i):
+        return "GET", f"{API}/fam-member/{self.member_id(i)}", None
+
+    def create_member(self, i):
+        return "POST", f"{API}/create-member", family(i)
+
+    def edit_member(self, i):
+        body = {
+            "occupation": f"Benchmark {i}",
+            "children": [person(f"Child{i}", "Male", child_type="son", mother_id="")],
+        }
+        return "POST", f"{API}/edit-member/{self.member_id(i)}", body
+
+    # warms the member in the other worker, edits it here, then times the
+    # other worker's read; a read without the new child counts as an error
+    def measure_other_worker(self, name, endpoint):
+        context = multiprocessing.get_context("spawn")
+        connection, reader_end = context.Pipe()
+        reader = context.Process(target=serve_reads, args=(reader_end,))
+        reader.start()
+        timings = []
+        queries = []
+        errors = 0
+        try:
+            for i in range(self.repeat):
+                member_id = self.member_id(i)
+                path = f"{API}/member/{member_id}"
+                connection.send((path, self.headers, endpoint))
+                connection.recv()
+                child = f"Otherworker{i}"
+                body = {
+                    "children": [person(child, "Male", child_type="son", mother_id="")]
+                }
+                self.request("POST", f"{API}/edit-member/{member_id}", body)
+                connection.send((path, self.headers, endpoint))
+                status, data, elapsed, count = connection.recv()
+                timings.append(elapsed)
+                queries.append(count)
+                errors += status != 200 or child not in json.dumps(data)
+        finally:
+            connection.send(None)
+            reader.join()
+        return self.result(name, timings, queries, errors)
+
+    # the family to delete is created outside the measured request
+    def delete_member(self, i):
+        data = family(f"Deleted{i}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            spouse, _ = create_member_with_spouse(data)
+        return "DELETE", f"{API}/delete-member/{spouse.husband_id}", None
+
+    def run(self):
+        cases = [
+            ("all-members", "account.all_members", self.all_members, False),
+            (
+                "all-members (cursor)",
+                "account.all_members",
+                self.all_members_cursor,
+                False,
+            ),
+            ("member", "account.get_one_member", self.member, False),
+            ("member (warm)", "account.get_one_member", self.member, True),
+            ("fam-member", "account.get_one_fam", self.fam_member, False),
+            ("fam-member (warm)", "account.get_one_fam", self.fam_member, True),
+            ("create-member", "account.create_fam_member", self.create_member, False),
+            ("edit-member", "account.edit_fam_member", self.edit_member, False),
+            ("delete-member", "account.delete_fam_member", self.delete_member, False),
+        ]
+        results = [
+            self.measure(name, endpoint, request_for, warm)
+            for name, endpoint, request_for, warm in cases
+        ]
+        results.append(
+            self.measure_other_worker("member (other worker)", "account.get_one_member")
+        )
+        return results
+
+
+# (members, seconds spent seeding, results) for every tree size, smallest
+# tree first
+def run_benchmarks(app, sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, seed=1):
+    for members in sorted(sizes):
+        benchmark = Benchmark(app, members, repeat, seed)
+        with app.app_context():
+            benchmark.seed_tree()
+            # the hot lookups must read through their index at every size
+            plans = [
+                {"name": name, "index": index, "used": used, "plan": plan}
+                for name, index, used, plan in check_lookups()
+            ]
+            yield members, benchmark.seed_seconds, benchmark.run(), plans
@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+
+DEFAULT_TTL = 300
+DEFAULT_MAXSIZE = 2048
+
+
+class MemoryCache:
+    """In-process LRU cache whose entries also expire after a TTL.
+
+    Version counters live apart from the LRU entries so they are never
+    evicted. They only count writes made by this process.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.ttl)
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def version(self, name):
+        return self.versions.get(name, 0)
+
+    def bump_version(self, name):
+        with self.lock:
+            self.versions[name] = self.versions.get(name, 0) + 1
+            return self.versions[name]
+
+
+class RedisCache:
+    """Cache shared by every worker, values stored as JSON in Redis."""
+
+    def __init__(self, url, ttl=DEFAULT_TTL, prefix="familytree:"):
+        # optional dependency, only needed when CACHE_BACKEND is "redis"
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl or self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}*"):
+            self.client.delete(key)
+
+    def version(self, name):
+        return int(self.client.get(f"{self.prefix}version:{name}") or 0)
+
+    def bump_version(self, name):
+        return self.client.incr(f"{self.prefix}version:{name}")
+
+
+class Cache:
+    """Cache extension; the backend is picked from the app config.
+
+    CACHE_BACKEND is "memory" (default) or "redis" with CACHE_REDIS_URL.
+    CACHE_DEFAULT_TTL and CACHE_MAXSIZE size the backend. Until init_app
+    runs, an in-process backend is used.
+
+    Lookups are counted per key namespace ("member", "identity", ...) until
+    take_lookups drains them.
+
+    The memory backend is per worker. Member views stay correct anyway,
+    since every worker replays the tree_change log before reading them,
+    but entries kept only by TTL (moderator identities, member counts) can
+    be stale on other workers until they expire. Run several workers with
+    "redis" when that matters; gunicorn.conf.py warns otherwise.
+    """
+
+    def __init__(self):
+        self.backend = MemoryCache()
+        self.lookups = Counter()
+        self.lookups_lock = threading.Lock()
+
+    def init_app(self, app):
+        ttl = app.config.get("CACHE_DEFAULT_TTL", DEFAULT_TTL)
+        if app.config.get("CACHE_BACKEND", "memory") == "redis":
+            self.backend = RedisCache(app.config["CACHE_REDIS_URL"], ttl)
+        else:
+            self.backend = MemoryCache(
+                app.config.get("CACHE_MAXSIZE", DEFAULT_MAXSIZE), ttl
+            )
+        app.extensions["cache"] = self
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self.lookups_lock:
+            self.lookups[key.split(":", 1)[0], value is not None] += 1
+        return value
+
+    def take_lookups(self):
+        with self.lookups_lock:
+            lookups, self.lookups = self.lookups, Counter()
+        return lookups
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl)
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def version(self, name):
+        return self.backend.version(name)
+
+    def bump_version(self, name):
+        return self.backend.bump_version(name)
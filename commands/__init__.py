@@ -0,0 +1,161 @@
+import click
+from flask import current_app
+from extensions import db
+from models import Member, MemberSearch
+from gedcom_io import import_gedcom, export_gedcom, export_ndjson, BATCH_SIZE
+from search import SEARCH_FIELDS, search_rows, phonetic_key
+from slow_queries import slow_query_report
+from synthetic import generate_tree
+from query_plans import check_lookups
+
+
+@click.command("explain-lookups")
+def explain_lookups():
+    """Check that the hot relationship lookups use their indexes."""
+    missing = 0
+    for name, index, used, plan in check_lookups():
+        missing += not used
+        click.echo(f"{'ok' if used else 'MISSING'}  {name}: expected {index}")
+        if not used:
+            click.echo(f"    plan: {plan}")
+    if missing:
+        raise click.ClickException(f"{missing} lookup(s) not using their index")
+
+
+@click.command("import-gedcom")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=BATCH_SIZE, show_default=True)
+def import_gedcom_command(path, batch_size):
+    """Import the individuals and families of a GEDCOM 5.5.1 file."""
+    with open(path, encoding="utf-8-sig", errors="replace") as lines:
+        report = import_gedcom(lines, batch_size)
+    for key, value in report.items():
+        click.echo(f"{key}: {value}")
+
+
+@click.command("export-tree")
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice(["gedcom", "ndjson"]),
+    default="gedcom",
+    show_default=True,
+)
+@click.option("--output", "-o", type=click.File("w", encoding="utf-8"), default="-")
+def export_tree_command(export_format, output):
+    """Stream the whole tree to a GEDCOM 5.5.1 or NDJSON file."""
+    lines = export_ndjson() if export_format == "ndjson" else export_gedcom()
+    for line in lines:
+        output.write(line)
+
+
+# keyset batches so the member table is never held in memory at once
+def member_batches(batch_size, *columns):
+    last_id = ""
+    while True:
+        members = db.session.execute(
+            db.select(Member.id, *columns)
+            .where(Member.id > last_id)
+            .order_by(Member.id)
+            .limit(batch_size)
+        ).all()
+        if not members:
+            return
+        yield members
+        last_id = members[-1].id
+
+
+@click.command("reindex-search")
+@click.option("--batch-size", default=BATCH_SIZE, show_default=True)
+def reindex_search_command(batch_size):
+    """Rebuild the member search index from the member table."""
+    columns = [getattr(Member, field) for field, _ in SEARCH_FIELDS]
+    db.session.execute(db.delete(MemberSearch))
+    indexed = 0
+    for members in member_batches(batch_size, *columns):
+        rows = [
+            row
+            for member in members
+            for row in search_rows(member.id, member._asdict())
+        ]
+        if rows:
+            db.session.execute(db.insert(MemberSearch), rows)
+        indexed += len(members)
+    db.session.commit()
+    click.echo(f"indexed {indexed} members")
+
+
+@click.command("backfill-name-keys")
+@click.option("--batch-size", default=BATCH_SIZE, show_default=True)
+def backfill_name_keys_command(batch_size):
+    """Fill the phonetic name keys used by fuzzy member search."""
+    updated = 0
+    for members in member_batches(batch_size, Member.first_name, Member.last_name):
+        db.session.execute(
+            db.update(Member),
+            [
+                {
+                    "id": member.id,
+                    "first_name_key": phonetic_key(member.first_name),
+                    "last_name_key": phonetic_key(member.last_name),
+                }
+                for member in members
+            ],
+        )
+        db.session.commit()
+        updated += len(members)
+    click.echo(f"updated {updated} members")
+
+
+@click.command("slow-queries")
+@click.option("--path", help="Log file, defaults to SLOW_QUERY_LOG.")
+@click.option("--limit", default=10, show_default=True)
+@click.option("--explain/--no-explain", default=True, show_default=True)
+def slow_queries_command(path, limit, explain):
+    """Report the slow-query log grouped by statement fingerprint."""
+    path = path or current_app.config.get("SLOW_QUERY_LOG")
+    if not path:
+        raise click.ClickException("no log file, set SLOW_QUERY_LOG or --path")
+    groups = slow_query_report(path)
+    if not groups:
+        click.echo("no slow queries logged")
+    for group in groups[:limit]:
+        click.echo(
+            f"{group['fingerprint']}  {group['count']}x  "
+            f"total {group['total_ms']:.1f} ms  "
+            f"avg {group['total_ms'] / group['count']:.1f} ms  "
+            f"max {group['max_ms']:.1f} ms"
+        )
+        click.echo(f"    endpoints: {', '.join(sorted(group['endpoints']))}")
+        click.echo(f"    parameters: {group['parameters']}")
+        click.echo(f"    {group['statement'][:500]}")
+        if explain and group["explain"]:
+            for row in group["explain"]:
+                click.echo(f"    plan: {row}")
+        click.echo()
+
+
+@click.command("generate-tree")
+@click.option("--members", default=1000, show_default=True)
+@click.option("--branching", default=3, show_default=True, help="Average children.")
+@click.option("--polygamy", default=0.1, show_default=True, help="0 to 1.")
+@click.option("--depth", default=5, show_default=True, help="Generations per tree.")
+@click.option("--seed", type=int, help="Same seed, same tree.")
+@click.option("--batch-size", default=BATCH_SIZE, show_default=True)
+def generate_tree_command(members, branching, polygamy, depth, seed, batch_size):
+    """Fill the database with synthetic multi-generation family trees."""
+    if members < 2 or depth < 1 or branching < 1 or not 0 <= polygamy <= 1:
+        raise click.ClickException(
+            "need --members >= 2, --depth >= 1, --branching >= 1 and "
+            "--polygamy between 0 and 1"
+        )
+    report = generate_tree(
+        members,
+        branching=branching,
+        polygamy=polygamy,
+        depth=depth,
+        seed=seed,
+        batch_size=batch_size,
+    )
+    for key, value in report.items():
+        click.echo(f"{key}: {value}")
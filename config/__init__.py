@@ -31,6 +31,7 @@
 
 
 import os
+import tempfile
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
@@ -51,6 +52,19 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY")
     JWT_ACCESS_TOKEN_EXPIRES = 86400
+    # per-request SQL counts as Server-Timing headers, see query_stats
+    QUERY_STATS_ENABLED = os.environ.get("QUERY_STATS_ENABLED") == "true"
+    # prometheus metrics at /metrics, see metrics and gunicorn.conf.py
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED") == "true"
+    # statements slower than the threshold are logged with their EXPLAIN
+    SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG")
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 100))
+    # cProfile output of flagged or sampled requests, see profiling
+    PROFILE_DIR = os.environ.get("PROFILE_DIR")
+    PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+    # "memory" is per worker, use "redis" with several workers, see cache
+    CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+    CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")
 
 
 # Development configuration
@@ -64,23 +78,36 @@ class DevelopmentConfig(Config):
     SQLALCHEMY_ENGINE_OPTIONS = {"pool_pre_ping": True}
 
 
+# Benchmark configuration, see benchmark.py; the database is wiped on every run
+class BenchmarkConfig(Config):
+    TESTING = True
+    # a file, not in-memory: the "(other worker)" case reads it from a second process
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        "BENCHMARK_DATABASE_URL",
+        "sqlite:///" + os.path.join(tempfile.gettempdir(), "familytree-benchmark.db"),
+    )
+    JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY") or "benchmark-secret-key-of-32-bytes"
+    QUERY_STATS_ENABLED = True
+
+
 # Config dictionary to choose the environment
 config_obj = {
-    "development": DevelopmentConfig
+    "development": DevelopmentConfig,
+    "benchmark": BenchmarkConfig,
 }
 
 # Set configuration for the app
 app.config.from_object(config_obj['development'])
 
-# Initialize the SQLAlchemy object
-db = SQLAlchemy(app)
-
-
 # Example route
 @app.route('/')
 def home():
     return "Connected  successfully!"
 
 
+# the SQLAlchemy object is only made when this file is run as a connection
+# check: it parses the MySQL URL, so importing the configs (benchmark.py,
+# app_config) would otherwise need every DB_* variable set
 if __name__ == '__main__':
+    db = SQLAlchemy(app)
     app.run(debug=True)
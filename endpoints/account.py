@@ -1,30 +1,62 @@
 from http_status import HttpStatus
 from status_res import StatusRes
-from flask import Blueprint, request, abort
+from flask import (
+    Blueprint,
+    request,
+    abort,
+    Response,
+    stream_with_context,
+    send_file,
+)
 from flask_jwt_extended import jwt_required
 import traceback
-from utils import return_response, validate_request_data
+import io
+from utils import (
+    return_response,
+    return_etag_response,
+    validate_request_data,
+    decode_cursor,
+)
 from models import (
     edit_member,
     email_exists,
     Moderators,
     get_all_members,
     create_member_with_spouse,
-    recursive_delete,
+    delete_member_tree,
     items_to_gallery,
     delete_gallery_item,
-    Gallery,
     create_mod,
-    get_family_chain,
+    get_cached_family_chain,
+    get_cached_fam_member,
+    get_gallery_etag,
+    get_gallery_view,
+    get_logo_settings,
+    LOGO_MAX_AGE,
     change_password,
     get_all_mods,
     update_mod,
-    get_one_fam_member,
     add_or_update_logo,
-    get_logo_details,
-    get_members_other_spouses,
+    members_to_dict,
+    get_descendants,
+    get_relationship,
+    get_kinship_path,
+    KINSHIP_PATH_HOPS,
+    get_ancestors,
+    nest_tree,
+    MAX_TREE_DEPTH,
+    get_members_by_cursor,
+    count_members,
+    search_members,
+    fuzzy_search_members,
+    suggest_members,
+    get_mods_by_cursor,
+    count_mods,
 )
 from decorators import super_admin_required
+from extensions import query_stats, profiler
+from profiling import profile_summary, PROFILE_SORTS
+from gedcom_io import import_gedcom, export_gedcom, export_ndjson, EXPORT_FORMATS
 import datetime
 import pprint
 from flask_jwt_extended import current_user
@@ -150,9 +182,9 @@ def create_fam_member():
 # @super_admin_required
 def delete_fam_member(member_id):
     try:
-        member = get_one_fam_member(member_id, delete=True)
-        recursive_delete(member)
-        if not member:
+        dry_run = request.args.get("dry_run") == "true"
+        report = delete_member_tree(member_id, dry_run=dry_run)
+        if not report:
             return return_response(
                 HttpStatus.NOT_FOUND,
                 status=StatusRes.FAILED,
@@ -161,7 +193,12 @@ def delete_fam_member(member_id):
         return return_response(
             HttpStatus.OK,
             status=StatusRes.SUCCESS,
-            message="Member deleted successfully",
+            message=(
+                "Members that would be deleted"
+                if dry_run
+                else "Member deleted successfully"
+            ),
+            data=report,
         )
     except Exception as e:
         print(traceback.format_exc(), "delete member traceback")
@@ -256,21 +293,226 @@ def edit_fam_member(member_id):
         )
 
 
+# import a GEDCOM file
+@account.route(f"{ACCOUNT_URL_PREFIX}/import-gedcom", methods=["POST"])
+@jwt_required()
+@super_admin_required
+def import_gedcom_file():
+    try:
+        upload = request.files.get("file")
+        if not upload:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="File is required",
+            )
+        lines = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", errors="replace")
+        report = import_gedcom(lines)
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="GEDCOM imported successfully",
+            data=report,
+        )
+    except Exception as e:
+        print(traceback.format_exc(), "import gedcom traceback")
+        print(e, "import gedcom error")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+# stream the whole tree as a GEDCOM or NDJSON download
+@account.route(f"{ACCOUNT_URL_PREFIX}/export", methods=["GET"])
+@jwt_required()
+@super_admin_required
+def export_tree():
+    try:
+        export_format = request.args.get("format", "gedcom")
+        if export_format not in EXPORT_FORMATS:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Invalid format",
+            )
+        extension, mimetype = EXPORT_FORMATS[export_format]
+        lines = export_gedcom() if export_format == "gedcom" else export_ndjson()
+        return Response(
+            stream_with_context(lines),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=family-tree.{extension}"
+            },
+        )
+    except Exception as e:
+        print(traceback.format_exc(), "export tree traceback")
+        print(e, "export tree error")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+# per-endpoint query counts and db time collected since the last reset
+@account.route(f"{ACCOUNT_URL_PREFIX}/query-stats", methods=["GET", "DELETE"])
+@jwt_required()
+@super_admin_required
+def get_query_stats():
+    try:
+        if not query_stats.enabled:
+            return return_response(
+                HttpStatus.NOT_FOUND,
+                status=StatusRes.FAILED,
+                message="Query stats are disabled",
+            )
+        if request.method == "DELETE":
+            query_stats.reset()
+            return return_response(
+                HttpStatus.OK, status=StatusRes.SUCCESS, message="Query stats reset"
+            )
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="Query stats retrieved",
+            data=query_stats.snapshot(),
+        )
+    except Exception as e:
+        print(traceback.format_exc(), "query stats traceback")
+        print(e, "query stats error")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+# request profiles written by the profiler, newest first
+@account.route(f"{ACCOUNT_URL_PREFIX}/profiles", methods=["GET"])
+@jwt_required()
+@super_admin_required
+def get_profiles():
+    try:
+        if not profiler.enabled:
+            return return_response(
+                HttpStatus.NOT_FOUND,
+                status=StatusRes.FAILED,
+                message="Profiling is disabled",
+            )
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="Profiles retrieved",
+            data=profiler.list_profiles(),
+        )
+    except Exception as e:
+        print(traceback.format_exc(), "get profiles traceback")
+        print(e, "get profiles error")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+# one profile as a pstats text summary, or the raw file with format=prof
+@account.route(f"{ACCOUNT_URL_PREFIX}/profiles/<name>", methods=["GET"])
+@jwt_required()
+@super_admin_required
+def get_profile(name):
+    try:
+        path = profiler.profile_path(name) if profiler.enabled else None
+        if not path:
+            return return_response(
+                HttpStatus.NOT_FOUND,
+                status=StatusRes.FAILED,
+                message="Profile not found",
+            )
+        if request.args.get("format") == "prof":
+            return send_file(path, as_attachment=True, download_name=name)
+        sort = request.args.get("sort", "cumulative")
+        if sort not in PROFILE_SORTS:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Invalid sort",
+            )
+        try:
+            limit = min(max(int(request.args.get("limit", 40)), 1), 100)
+        except ValueError:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Limit must be a number",
+            )
+        summary = profile_summary(path, sort=sort, limit=limit)
+        return Response(summary, mimetype="text/plain")
+    except Exception as e:
+        print(traceback.format_exc(), "get profile traceback")
+        print(e, "get profile error")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
 # get all members
 @account.route(f"{ACCOUNT_URL_PREFIX}/all-members", methods=["GET"])
 @jwt_required()
 def all_members():
     try:
-        page = int(request.args.get("page", 1))
-        per_page = int(request.args.get("per_page", 10))
+        try:
+            per_page = int(request.args.get("per_page", 10))
+        except ValueError:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Per page must be a number",
+            )
         fullname = request.args.get("fullname")
+        cursor = request.args.get("cursor")
+        if cursor is not None:
+            per_page = min(max(per_page, 1), 100)
+            values = decode_cursor(cursor) if cursor else []
+            if values is None:
+                return return_response(
+                    HttpStatus.BAD_REQUEST,
+                    status=StatusRes.FAILED,
+                    message="Invalid cursor",
+                )
+            try:
+                members, next_cursor = get_members_by_cursor(values, per_page, fullname)
+            except (TypeError, ValueError):
+                return return_response(
+                    HttpStatus.BAD_REQUEST,
+                    status=StatusRes.FAILED,
+                    message="Invalid cursor",
+                )
+            data = {
+                "members": members_to_dict(members),
+                "next_cursor": next_cursor,
+                "per_page": per_page,
+            }
+            if request.args.get("with_total") == "true":
+                data["total_items"] = count_members(fullname)
+            return return_response(
+                HttpStatus.OK,
+                status=StatusRes.SUCCESS,
+                message="All members retrieved",
+                data=data,
+            )
+
+        page = int(request.args.get("page", 1))
         members = get_all_members(page, per_page, fullname)
         return return_response(
             HttpStatus.OK,
             status=StatusRes.SUCCESS,
             message="All members retrieved",
             data={
-                "members": [member.to_dict() for member in members.items],
+                "members": members_to_dict(members.items),
                 "total_items": members.total,
                 "page": members.page,
                 "per_page": members.per_page,
@@ -287,19 +529,77 @@ def all_members():
         )
 
 
+# search members by name, birth name, birth place and occupation;
+# mode=fuzzy matches names by sound instead
+@account.route(f"{ACCOUNT_URL_PREFIX}/members/search", methods=["GET"])
+@jwt_required()
+def search_members_endpoint():
+    try:
+        q = request.args.get("q", "")
+        page = max(int(request.args.get("page", 1)), 1)
+        per_page = min(max(int(request.args.get("per_page", 10)), 1), 100)
+        if request.args.get("mode") == "fuzzy":
+            members, has_next = fuzzy_search_members(q, page, per_page)
+        else:
+            members, has_next = search_members(q, page, per_page)
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="Members found",
+            data={
+                "members": members_to_dict(members),
+                "page": page,
+                "per_page": per_page,
+                "has_next": has_next,
+            },
+        )
+    except Exception as e:
+        print(traceback.format_exc(), "search members traceback")
+        print(e, "search members error")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+# autocomplete for the member picker, answered from memory
+@account.route(f"{ACCOUNT_URL_PREFIX}/members/suggest", methods=["GET"])
+@jwt_required()
+def suggest_members_endpoint():
+    try:
+        q = request.args.get("q", "")
+        limit = min(max(int(request.args.get("limit", 10)), 1), 50)
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="Suggestions retrieved",
+            data={"members": suggest_members(q, limit)},
+        )
+    except Exception as e:
+        print(traceback.format_exc(), "suggest members traceback")
+        print(e, "suggest members error")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
 # get one member
 @account.route(f"{ACCOUNT_URL_PREFIX}/member/<member_id>", methods=["GET"])
 @jwt_required()
 def get_one_member(member_id):
     try:
-        member = get_family_chain(member_id)
+        member, etag = get_cached_family_chain(member_id)
         if not member:
             return return_response(
                 HttpStatus.NOT_FOUND,
                 status=StatusRes.FAILED,
                 message="Member not found",
             )
-        return return_response(
+        return return_etag_response(
+            etag,
             HttpStatus.OK,
             status=StatusRes.SUCCESS,
             message="Member retrieved",
@@ -315,25 +615,209 @@ def get_one_member(member_id):
         )
 
 
+# how another member is related to a member
+@account.route(
+    f"{ACCOUNT_URL_PREFIX}/member/<member_id>/relationship/<other_id>",
+    methods=["GET"],
+)
+@jwt_required()
+def get_member_relationship(member_id, other_id):
+    try:
+        try:
+            depth = int(request.args.get("depth", MAX_TREE_DEPTH))
+        except ValueError:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Depth must be a number",
+            )
+        relationship = get_relationship(member_id, other_id, depth)
+        if not relationship:
+            return return_response(
+                HttpStatus.NOT_FOUND,
+                status=StatusRes.FAILED,
+                message="Member not found",
+            )
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message=(
+                "Relationship retrieved"
+                if relationship["relationship"]
+                else "No relationship found"
+            ),
+            data=relationship,
+        )
+    except Exception as e:
+        print(traceback.format_exc(), "get relationship traceback")
+        print(e, "get relationship error")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+# shortest chain of family links between two members
+@account.route(
+    f"{ACCOUNT_URL_PREFIX}/member/<member_id>/path/<other_id>", methods=["GET"]
+)
+@jwt_required()
+def get_member_kinship_path(member_id, other_id):
+    try:
+        try:
+            max_hops = int(request.args.get("max_hops", KINSHIP_PATH_HOPS))
+        except ValueError:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Max hops must be a number",
+            )
+        kinship_path = get_kinship_path(member_id, other_id, max_hops)
+        if not kinship_path:
+            return return_response(
+                HttpStatus.NOT_FOUND,
+                status=StatusRes.FAILED,
+                message="Member not found",
+            )
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message=(
+                "Path retrieved"
+                if kinship_path["path"]
+                else "No path found within max hops"
+            ),
+            data=kinship_path,
+        )
+    except Exception as e:
+        print(traceback.format_exc(), "get kinship path traceback")
+        print(e, "get kinship path error")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+# get a member's descendants
+@account.route(f"{ACCOUNT_URL_PREFIX}/member/<member_id>/descendants", methods=["GET"])
+@jwt_required()
+def get_member_descendants(member_id):
+    try:
+        try:
+            depth = int(request.args.get("depth", 3))
+        except ValueError:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Depth must be a number",
+            )
+        output = request.args.get("format", "nested")
+        if output not in ["nested", "flat"]:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Format must be nested or flat",
+            )
+
+        entries = get_descendants(member_id, depth)
+        if not entries:
+            return return_response(
+                HttpStatus.NOT_FOUND,
+                status=StatusRes.FAILED,
+                message="Member not found",
+            )
+        data = (
+            {"tree": nest_tree(member_id, entries)}
+            if output == "nested"
+            else {"members": entries}
+        )
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="Descendants retrieved",
+            depth=min(max(depth, 0), MAX_TREE_DEPTH),
+            **data,
+        )
+    except Exception as e:
+        print(traceback.format_exc(), "get descendants traceback")
+        print(e, "get descendants error")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
+# get a member's ancestors
+@account.route(f"{ACCOUNT_URL_PREFIX}/member/<member_id>/ancestors", methods=["GET"])
+@jwt_required()
+def get_member_ancestors(member_id):
+    try:
+        try:
+            depth = int(request.args.get("depth", 3))
+        except ValueError:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Depth must be a number",
+            )
+        output = request.args.get("format", "nested")
+        if output not in ["nested", "flat"]:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Format must be nested or flat",
+            )
+
+        entries = get_ancestors(member_id, depth)
+        if not entries:
+            return return_response(
+                HttpStatus.NOT_FOUND,
+                status=StatusRes.FAILED,
+                message="Member not found",
+            )
+        data = (
+            {"tree": nest_tree(member_id, entries, "child_id", "parents")}
+            if output == "nested"
+            else {"members": entries}
+        )
+        return return_response(
+            HttpStatus.OK,
+            status=StatusRes.SUCCESS,
+            message="Ancestors retrieved",
+            depth=min(max(depth, 0), MAX_TREE_DEPTH),
+            **data,
+        )
+    except Exception as e:
+        print(traceback.format_exc(), "get ancestors traceback")
+        print(e, "get ancestors error")
+        return return_response(
+            HttpStatus.INTERNAL_SERVER_ERROR,
+            status=StatusRes.FAILED,
+            message="Network Error",
+        )
+
+
 # get one fam member
 @account.route(f"{ACCOUNT_URL_PREFIX}/fam-member/<member_id>", methods=["GET"])
 @jwt_required()
 def get_one_fam(member_id):
     try:
-        member = get_one_fam_member(member_id)
-        other_spouse = get_members_other_spouses(member_id)
+        member, etag = get_cached_fam_member(member_id)
         if not member:
             return return_response(
                 HttpStatus.NOT_FOUND,
                 status=StatusRes.FAILED,
                 message="Member not found",
             )
-        return return_response(
+        return return_etag_response(
+            etag,
             HttpStatus.OK,
             status=StatusRes.SUCCESS,
             message="Member retrieved",
             **member,
-            other_spouse_list=other_spouse,
         )
     except Exception as e:
         print(traceback.format_exc(), "get one member traceback")
@@ -415,10 +899,42 @@ def create_moderator():
 @super_admin_required
 def all_moderators():
     try:
-        page = int(request.args.get("page", 1))
-        per_page = int(request.args.get("per_page", 10))
+        try:
+            per_page = int(request.args.get("per_page", 10))
+        except ValueError:
+            return return_response(
+                HttpStatus.BAD_REQUEST,
+                status=StatusRes.FAILED,
+                message="Per page must be a number",
+            )
         fullname = request.args.get("fullname")
         email = request.args.get("email")
+        cursor = request.args.get("cursor")
+        if cursor is not None:
+            per_page = min(max(per_page, 1), 100)
+            values = decode_cursor(cursor) if cursor else []
+            if values is None:
+                return return_response(
+                    HttpStatus.BAD_REQUEST,
+                    status=StatusRes.FAILED,
+                    message="Invalid cursor",
+                )
+            mods, next_cursor = get_mods_by_cursor(values, per_page, fullname, email)
+            data = {
+                "mods": [mod.to_dict() for mod in mods],
+                "next_cursor": next_cursor,
+                "per_page": per_page,
+            }
+            if request.args.get("with_total") == "true":
+                data["total_items"] = count_mods(fullname, email)
+            return return_response(
+                HttpStatus.OK,
+                status=StatusRes.SUCCESS,
+                message="All mods retrieved",
+                **data,
+            )
+
+        page = int(request.args.get("page", 1))
         mods = get_all_mods(page, per_page, fullname, email)
         return return_response(
             HttpStatus.OK,
@@ -616,14 +1132,13 @@ def add_to_gallery():
 @jwt_required()
 def get_gallery():
     try:
-        galleries = Gallery.query.all()
+        etag = get_gallery_etag()
+        gallery_list = None
+        if not request.if_none_match.contains(etag):
+            gallery_list, etag = get_gallery_view()
 
-        print("Getting items from gallery", galleries)
-        gallery_list = [g.to_dict() for g in galleries]
-
-        print(gallery_list)
-
-        return return_response(
+        return return_etag_response(
+            etag,
             HttpStatus.OK,
             status=StatusRes.SUCCESS,
             data=gallery_list,
@@ -681,9 +1196,15 @@ def delete_gallery(gallery_id):
 def add_to_logo():
     try:
         if request.method == "GET":
-            data = get_logo_details()
+            data, etag = get_logo_settings()
 
-            return return_response(HttpStatus.OK, status=StatusRes.SUCCESS, **data)
+            response = return_etag_response(
+                etag, HttpStatus.OK, status=StatusRes.SUCCESS, **data
+            )
+            # behind a JWT, so only the client may keep it, not shared caches
+            response.cache_control.private = True
+            response.cache_control.max_age = LOGO_MAX_AGE
+            return response
 
         data = request.get_json()
 
@@ -3,6 +3,11 @@ from flask_jwt_extended import JWTManager
 from sqlalchemy import MetaData
 from flask_migrate import Migrate
 from flask_cors import CORS
+from cache import Cache
+from query_stats import QueryStats
+from metrics import Metrics
+from slow_queries import SlowQueryLog
+from profiling import Profiler
 
 naming_convention = {
     "ix": 'ix_%(column_0_label)s',
@@ -16,3 +21,8 @@ db = SQLAlchemy(metadata=MetaData(naming_convention=naming_convention))
 jwt = JWTManager()
 migrate = Migrate()
 cors = CORS()
+cache = Cache()
+query_stats = QueryStats()
+metrics = Metrics()
+slow_queries = SlowQueryLog()
+profiler = Profiler()
@@ -0,0 +1,622 @@
+import re
+import json
+from enum import Enum
+from datetime import datetime
+from extensions import db
+from utils import hex_uuid
+from models import (
+    Member,
+    Spouse,
+    OtherSpouse,
+    Child,
+    Gender,
+    Status,
+    ChildType,
+    RelationshipType,
+    MemberSearch,
+    queue_graph_patch,
+    queue_suggest_patch,
+)
+from search import search_rows, phonetic_key
+
+BATCH_SIZE = 1000
+
+LINE_RE = re.compile(r"^\s*(\d+)\s+(?:(@[^@]+@)\s+)?(\S+)(?:\s(.*))?$")
+
+MONTHS = {
+    "JAN": 1,
+    "FEB": 2,
+    "MAR": 3,
+    "APR": 4,
+    "MAY": 5,
+    "JUN": 6,
+    "JUL": 7,
+    "AUG": 8,
+    "SEP": 9,
+    "OCT": 10,
+    "NOV": 11,
+    "DEC": 12,
+}
+
+DATE_QUALIFIERS = {"ABT", "CAL", "EST", "BEF", "AFT", "FROM", "TO", "BET", "INT"}
+
+
+class GedcomNode:
+    __slots__ = ("tag", "xref", "value", "children")
+
+    def __init__(self, tag, xref=None, value=""):
+        self.tag = tag
+        self.xref = xref
+        self.value = value
+        self.children = []
+
+    def first(self, tag):
+        for child in self.children:
+            if child.tag == tag:
+                return child
+        return None
+
+    def all(self, tag):
+        return [child for child in self.children if child.tag == tag]
+
+    def text(self, tag=None):
+        node = self.first(tag) if tag else self
+        if not node:
+            return None
+        # CONC/CONT continue a long value on the following lines
+        value = node.value or ""
+        for child in node.children:
+            if child.tag == "CONC":
+                value += child.value
+            elif child.tag == "CONT":
+                value += "\n" + child.value
+        return value.strip() or None
+
+
+# stream the level 0 records of a GEDCOM file one at a time, so only the
+# record being read is held in memory
+def iter_records(lines):
+    record, stack = None, []
+    for line in lines:
+        match = LINE_RE.match(line.rstrip("\r\n"))
+        if not match:
+            continue
+        level, xref, tag, value = match.groups()
+        level = int(level)
+        node = GedcomNode(tag.upper(), xref, value or "")
+        if level == 0:
+            if record:
+                yield record
+            record, stack = node, [node]
+            continue
+        if not stack:
+            continue
+        del stack[level:]
+        stack[-1].children.append(node)
+        stack.append(node)
+    if record:
+        yield record
+
+
+def parse_date(value):
+    if not value:
+        return None
+    tokens = value.upper().replace(".", " ").split()
+    while tokens and tokens[0] in DATE_QUALIFIERS:
+        tokens = tokens[1:]
+    # keep only the first date of a range such as "BET 1900 AND 1910"
+    if "AND" in tokens:
+        tokens = tokens[: tokens.index("AND")]
+    if "TO" in tokens:
+        tokens = tokens[: tokens.index("TO")]
+    day, month, year = 1, 1, None
+    try:
+        if len(tokens) >= 3:
+            day, month, year = int(tokens[0]), MONTHS[tokens[1]], tokens[2]
+        elif len(tokens) == 2:
+            month, year = MONTHS[tokens[0]], tokens[1]
+        elif len(tokens) == 1:
+            year = tokens[0]
+        else:
+            return None
+        year = int(re.match(r"\d+", year).group())
+        return datetime(year, month, day)
+    except (KeyError, ValueError, AttributeError):
+        return None
+
+
+def parse_name(node):
+    if not node:
+        return "", ""
+    raw = node.value or ""
+    given = node.text("GIVN")
+    surname = node.text("SURN")
+    match = re.match(r"^(.*?)/(.*?)/(.*)$", raw)
+    if match:
+        given = given or (match.group(1) + " " + match.group(3)).strip()
+        surname = surname or match.group(2).strip()
+    else:
+        given = given or raw.strip()
+    return given or "", surname or ""
+
+
+def clip(value, length):
+    return value[:length] if value else value
+
+
+CHILD_TYPES = {
+    ("birth", Gender.male): ChildType.son,
+    ("birth", Gender.female): ChildType.daughter,
+    ("adopted", Gender.male): ChildType.adopted_son,
+    ("adopted", Gender.female): ChildType.adopted_daughter,
+    ("step", Gender.male): ChildType.step_son,
+    ("step", Gender.female): ChildType.step_daughter,
+}
+
+
+def pedigree(value):
+    value = (value or "").lower()
+    if value in ("adopted", "foster"):
+        return "adopted"
+    if value == "step":
+        return "step"
+    return "birth"
+
+
+class GedcomImporter:
+    """Map INDI/FAM records onto Member, Spouse, OtherSpouse and Child.
+
+    Individuals are inserted in batches while the file streams. Families
+    only keep the xrefs they point at until the end of the file, when they
+    are resolved against the imported members. A couple shares one Spouse
+    row. A husband's further wives become OtherSpouse rows on his Spouse
+    row, their children attached to it with mother_id set to the wife, the
+    same shape create-member and edit-member produce. A wife's further
+    husband gets a Spouse row of his own, since a Spouse row's husband is
+    its children's father, and an OtherSpouse row on hers. A family with
+    one known parent who already has a Spouse row gets its own row too.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.members = {}
+        self.pedigrees = {}
+        self.families = []
+        self.pending = []
+        self.report = {
+            "members": 0,
+            "spouses": 0,
+            "other_spouses": 0,
+            "children": 0,
+            "skipped": 0,
+        }
+
+    def insert(self, model, rows):
+        for i in range(0, len(rows), self.batch_size):
+            db.session.execute(db.insert(model), rows[i : i + self.batch_size])
+
+    def flush_members(self):
+        if self.pending:
+            self.insert(Member, self.pending)
+            self.insert(
+                MemberSearch,
+                [
+                    row
+                    for member in self.pending
+                    for row in search_rows(member["id"], member)
+                ],
+            )
+            self.report["members"] += len(self.pending)
+            self.pending = []
+
+    def add_individual(self, record):
+        sex = (record.text("SEX") or "").upper()
+        gender = {"M": Gender.male, "F": Gender.female}.get(sex[:1])
+        if not gender:
+            # every member needs a gender; individuals with none are skipped
+            self.report["skipped"] += 1
+            return
+        given, surname = parse_name(record.first("NAME"))
+        birth = record.first("BIRT")
+        death = record.first("DEAT")
+        note = record.text("NOTE")
+        member_id = hex_uuid()
+        self.members[record.xref] = (member_id, gender)
+        for famc in record.all("FAMC"):
+            kind = pedigree(famc.text("PEDI"))
+            if kind != "birth":
+                self.pedigrees[(record.xref, famc.value)] = kind
+        self.pending.append(
+            {
+                "id": member_id,
+                "first_name": clip(given.lower(), 50),
+                "last_name": clip(surname.lower(), 50),
+                "first_name_key": phonetic_key(given),
+                "last_name_key": phonetic_key(surname),
+                "gender": gender,
+                "dob": parse_date(birth.text("DATE")) if birth else None,
+                "status": Status.deceased if death else Status.alive,
+                "deceased_at": parse_date(death.text("DATE")) if death else None,
+                "occupation": clip(record.text("OCCU"), 50),
+                "birth_place": clip(birth.text("PLAC"), 150) if birth else None,
+                "birth_name": clip(" ".join(filter(None, [given, surname])), 150),
+                "story_line": note if note and not note.startswith("@") else None,
+                "created_at": datetime.now(),
+            }
+        )
+        if len(self.pending) >= self.batch_size:
+            self.flush_members()
+
+    def add_family(self, record):
+        children = []
+        for chil in record.all("CHIL"):
+            kinds = {pedigree(chil.text("_FREL")), pedigree(chil.text("_MREL"))}
+            kind = (
+                "adopted" if "adopted" in kinds else "step" if "step" in kinds else None
+            )
+            children.append((chil.value, kind))
+        self.families.append(
+            (
+                record.xref,
+                (record.first("HUSB") or GedcomNode("HUSB")).value,
+                (record.first("WIFE") or GedcomNode("WIFE")).value,
+                children,
+                bool(record.first("DIV")),
+            )
+        )
+
+    def resolve_families(self):
+        primary, spouses, links = {}, [], []
+
+        def family_row(husband_id, wife_id):
+            row = {"id": hex_uuid(), "husband_id": husband_id, "wife_id": wife_id}
+            spouses.append(row)
+            return row
+
+        for fam_xref, husband, wife, children, divorced in self.families:
+            husband_id = self.members.get(husband, (None,))[0]
+            wife_id = self.members.get(wife, (None,))[0]
+            if not husband_id and not wife_id:
+                continue
+            husband_row = primary.get(husband_id)
+            wife_row = primary.get(wife_id)
+            mother_id, other = None, None
+            if husband_row and husband_row is wife_row:
+                row = husband_row
+            elif (husband_row and not wife_id) or (wife_row and not husband_id):
+                # the other parent is unknown, not the partner already married
+                row = family_row(husband_id, wife_id)
+            elif husband_row and not husband_row["wife_id"] and not wife_row:
+                row = husband_row
+                row["wife_id"] = wife_id
+                primary[wife_id] = row
+            elif wife_row and not wife_row["husband_id"] and not husband_row:
+                row = wife_row
+                row["husband_id"] = husband_id
+                primary[husband_id] = row
+            elif husband_row:
+                row, mother_id = husband_row, wife_id
+                relationship = "ex_wife" if divorced else "wife"
+                other = (wife_id, husband_id, relationship, husband_row)
+            elif wife_row:
+                # the children's father is this husband, so the family gets
+                # its own row rather than hanging off her first husband's
+                row = family_row(husband_id, wife_id)
+                primary[husband_id] = row
+                relationship = "ex_husband" if divorced else "husband"
+                other = (husband_id, wife_id, relationship, wife_row)
+            else:
+                row = family_row(husband_id, wife_id)
+                for member_id in (husband_id, wife_id):
+                    if member_id:
+                        primary[member_id] = row
+            links.append((fam_xref, row, mother_id, other, children))
+        return spouses, links
+
+    def finish(self):
+        self.flush_members()
+        spouses, links = self.resolve_families()
+        self.insert(Spouse, spouses)
+        self.report["spouses"] = len(spouses)
+
+        other_spouses, children, seen = [], [], set()
+        for fam_xref, row, mother_id, other, family_children in links:
+            if other:
+                member_id, related_to, relationship, related_row = other
+                other_spouses.append(
+                    {
+                        "id": hex_uuid(),
+                        "member_id": member_id,
+                        "member_related_to": related_to,
+                        "relationship_type": RelationshipType[relationship],
+                        "spouse_id": related_row["id"],
+                    }
+                )
+            for child_xref, kind in family_children:
+                member = self.members.get(child_xref)
+                # a member can only be recorded as a child once
+                if not member or member[0] in seen:
+                    continue
+                seen.add(member[0])
+                kind = kind or self.pedigrees.get((child_xref, fam_xref), "birth")
+                children.append(
+                    {
+                        "id": hex_uuid(),
+                        "member_id": member[0],
+                        "spouse_id": row["id"],
+                        "mother_id": mother_id,
+                        "child_type": CHILD_TYPES[(kind, member[1])],
+                    }
+                )
+            if len(children) >= self.batch_size:
+                self.insert(Child, children)
+                self.report["children"] += len(children)
+                children = []
+        self.insert(OtherSpouse, other_spouses)
+        self.insert(Child, children)
+        self.report["other_spouses"] = len(other_spouses)
+        self.report["children"] += len(children)
+        return self.report
+
+    def run(self, lines):
+        for record in iter_records(lines):
+            if record.tag == "INDI" and record.xref:
+                self.add_individual(record)
+            elif record.tag == "FAM":
+                self.add_family(record)
+        return self.finish()
+
+
+# import a GEDCOM stream in one transaction
+def import_gedcom(lines, batch_size=BATCH_SIZE):
+    try:
+        report = GedcomImporter(batch_size).run(lines)
+        # bulk inserts bypass the patches, the graph and the suggest index
+        # are rebuilt on the next read
+        queue_graph_patch("reset")
+        queue_suggest_patch("reset")
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return report
+
+
+YIELD_PER = 1000
+
+EXPORT_FORMATS = {
+    "gedcom": ("ged", "text/x-gedcom"),
+    "ndjson": ("ndjson", "application/x-ndjson"),
+}
+
+EX_RELATIONSHIPS = (
+    RelationshipType.ex_wife,
+    RelationshipType.ex_husband,
+    RelationshipType.ex_partner,
+)
+
+MONTH_NAMES = list(MONTHS)
+
+EXPORT_COLUMNS = (
+    Member.id,
+    Member.first_name,
+    Member.last_name,
+    Member.gender,
+    Member.dob,
+    Member.status,
+    Member.deceased_at,
+    Member.img_str,
+    Member.phone_number,
+    Member.occupation,
+    Member.birth_place,
+    Member.birth_name,
+    Member.story_line,
+)
+
+
+# rows are fetched through a server-side cursor, YIELD_PER at a time; only
+# one stream can be open on the connection, so streams are read one after
+# the other
+def stream(statement):
+    return db.session.execute(statement.execution_options(yield_per=YIELD_PER))
+
+
+def format_date(value):
+    if not value:
+        return None
+    return f"{value.day} {MONTH_NAMES[value.month - 1]} {value.year}"
+
+
+def export_value(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+
+def export_ndjson():
+    tables = (
+        ("member", EXPORT_COLUMNS),
+        ("spouse", (Spouse.id, Spouse.husband_id, Spouse.wife_id)),
+        (
+            "other_spouse",
+            (
+                OtherSpouse.id,
+                OtherSpouse.member_id,
+                OtherSpouse.member_related_to,
+                OtherSpouse.relationship_type,
+                OtherSpouse.spouse_id,
+            ),
+        ),
+        (
+            "child",
+            (
+                Child.id,
+                Child.member_id,
+                Child.spouse_id,
+                Child.mother_id,
+                Child.child_type,
+            ),
+        ),
+    )
+    for record_type, columns in tables:
+        for row in stream(db.select(*columns)):
+            record = {"type": record_type}
+            record.update(
+                (key, export_value(value)) for key, value in row._mapping.items()
+            )
+            yield json.dumps(record) + "\n"
+
+
+def gedcom_lines(level, tag, value=None):
+    if value is None:
+        yield f"{level} {tag}\n"
+        return
+    lines = str(value).splitlines() or [""]
+    yield f"{level} {tag} {lines[0]}".rstrip() + "\n"
+    for line in lines[1:]:
+        yield f"{level + 1} CONT {line}".rstrip() + "\n"
+
+
+class GedcomExporter:
+    """Stream the whole tree as GEDCOM 5.5.1.
+
+    Every Spouse row and every OtherSpouse row becomes a FAM. Children go to
+    the other-spouse family when their mother_id is that other spouse, and
+    to the Spouse family otherwise. The relationship maps are built from
+    compact id tuples first so the INDI records can carry FAMS/FAMC links
+    without loading Member rows into memory.
+    """
+
+    def __init__(self):
+        self.family_xrefs = {}
+        self.member_xrefs = {}
+        self.fams = {}
+        self.famc = {}
+        self.family_children = {}
+        self.other_families = {}
+
+    def family_xref(self, key):
+        if key not in self.family_xrefs:
+            self.family_xrefs[key] = f"@F{len(self.family_xrefs) + 1}@"
+        return self.family_xrefs[key]
+
+    def member_xref(self, member_id):
+        if member_id not in self.member_xrefs:
+            self.member_xrefs[member_id] = f"@I{len(self.member_xrefs) + 1}@"
+        return self.member_xrefs[member_id]
+
+    def link_partner(self, member_id, family):
+        if member_id:
+            self.fams.setdefault(member_id, []).append(family)
+
+    def build_links(self):
+        for spouse_id, husband_id, wife_id in stream(
+            db.select(Spouse.id, Spouse.husband_id, Spouse.wife_id)
+        ):
+            family = self.family_xref(("spouse", spouse_id))
+            self.link_partner(husband_id, family)
+            self.link_partner(wife_id, family)
+        for other_id, member_id, related_to, spouse_id in stream(
+            db.select(
+                OtherSpouse.id,
+                OtherSpouse.member_id,
+                OtherSpouse.member_related_to,
+                OtherSpouse.spouse_id,
+            )
+        ):
+            family = self.family_xref(("other", other_id))
+            self.link_partner(member_id, family)
+            self.link_partner(related_to, family)
+            self.other_families[(spouse_id, member_id)] = family
+        for member_id, spouse_id, mother_id, child_type in stream(
+            db.select(
+                Child.member_id, Child.spouse_id, Child.mother_id, Child.child_type
+            )
+        ):
+            family = self.other_families.get((spouse_id, mother_id))
+            if not family and spouse_id:
+                family = self.family_xref(("spouse", spouse_id))
+            if not family:
+                continue
+            self.famc[member_id] = (family, child_type)
+            self.family_children.setdefault(family, []).append((member_id, child_type))
+
+    def individual(self, row):
+        yield from gedcom_lines(0, f"{self.member_xref(row.id)} INDI")
+        given = (row.first_name or "").title()
+        surname = (row.last_name or "").title()
+        yield from gedcom_lines(1, "NAME", f"{given} /{surname}/")
+        yield from gedcom_lines(1, "SEX", "M" if row.gender == Gender.male else "F")
+        yield from gedcom_lines(1, "REFN", row.id)
+        if row.dob or row.birth_place:
+            yield from gedcom_lines(1, "BIRT")
+            if row.dob:
+                yield from gedcom_lines(2, "DATE", format_date(row.dob))
+            if row.birth_place:
+                yield from gedcom_lines(2, "PLAC", row.birth_place)
+        if row.status == Status.deceased:
+            yield from gedcom_lines(1, "DEAT", None if row.deceased_at else "Y")
+            if row.deceased_at:
+                yield from gedcom_lines(2, "DATE", format_date(row.deceased_at))
+        if row.occupation:
+            yield from gedcom_lines(1, "OCCU", row.occupation)
+        if row.story_line:
+            yield from gedcom_lines(1, "NOTE", row.story_line)
+        if row.id in self.famc:
+            family, child_type = self.famc[row.id]
+            yield from gedcom_lines(1, "FAMC", family)
+            if child_type in (ChildType.adopted_son, ChildType.adopted_daughter):
+                yield from gedcom_lines(2, "PEDI", "adopted")
+        for family in self.fams.get(row.id, []):
+            yield from gedcom_lines(1, "FAMS", family)
+
+    def family(self, family, husband_id, wife_id, divorced=False):
+        yield from gedcom_lines(0, f"{family} FAM")
+        if husband_id:
+            yield from gedcom_lines(1, "HUSB", self.member_xref(husband_id))
+        if wife_id:
+            yield from gedcom_lines(1, "WIFE", self.member_xref(wife_id))
+        if divorced:
+            yield from gedcom_lines(1, "DIV", "Y")
+        for member_id, child_type in self.family_children.get(family, []):
+            yield from gedcom_lines(1, "CHIL", self.member_xref(member_id))
+            if child_type in (ChildType.step_son, ChildType.step_daughter):
+                yield from gedcom_lines(2, "_FREL", "Step")
+                yield from gedcom_lines(2, "_MREL", "Step")
+            elif child_type in (ChildType.adopted_son, ChildType.adopted_daughter):
+                yield from gedcom_lines(2, "_FREL", "Adopted")
+                yield from gedcom_lines(2, "_MREL", "Adopted")
+
+    def run(self):
+        yield "0 HEAD\n1 SOUR FamilyTree\n1 GEDC\n2 VERS 5.5.1\n"
+        yield "2 FORM LINEAGE-LINKED\n1 CHAR UTF-8\n"
+        self.build_links()
+        for row in stream(db.select(*EXPORT_COLUMNS)):
+            yield "".join(self.individual(row))
+        for spouse_id, husband_id, wife_id in stream(
+            db.select(Spouse.id, Spouse.husband_id, Spouse.wife_id)
+        ):
+            family = self.family_xref(("spouse", spouse_id))
+            yield "".join(self.family(family, husband_id, wife_id))
+        for other_id, member_id, related_to, relationship, gender in stream(
+            db.select(
+                OtherSpouse.id,
+                OtherSpouse.member_id,
+                OtherSpouse.member_related_to,
+                OtherSpouse.relationship_type,
+                Member.gender,
+            ).join(Member, OtherSpouse.member_id == Member.id)
+        ):
+            family = self.family_xref(("other", other_id))
+            divorced = relationship in EX_RELATIONSHIPS
+            if gender == Gender.male:
+                yield "".join(self.family(family, member_id, related_to, divorced))
+            else:
+                yield "".join(self.family(family, related_to, member_id, divorced))
+        yield "0 TRLR\n"
+
+
+def export_gedcom():
+    return GedcomExporter().run()
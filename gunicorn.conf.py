@@ -0,0 +1,26 @@
+import os
+import shutil
+
+# workers share their metrics through mmap files in this directory; it has
+# to be set before prometheus_client is imported anywhere
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/familytree-metrics")
+
+
+def on_starting(server):
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    # the memory cache is per worker, see cache.Cache
+    if server.cfg.workers > 1 and os.environ.get("CACHE_BACKEND", "memory") != "redis":
+        server.log.warning(
+            "CACHE_BACKEND is not redis: %d workers keep separate caches and "
+            "may serve moderator identities and member counts stale by up "
+            "to their TTL",
+            server.cfg.workers,
+        )
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
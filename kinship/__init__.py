@@ -0,0 +1,609 @@
+import threading
+from array import array
+from bisect import insort
+
+NO_NODE = -1
+
+
+class KinshipGraph:
+    """Compact in-process index of the family relationships.
+
+    Members are mapped to integer nodes. Spouse, OtherSpouse and Child rows
+    are kept as parallel arrays indexed by row number, and every node keeps
+    the row numbers it takes part in. Rows only ever get appended, so the
+    per-node lists stay in insertion order, which is the order the tables
+    return them in. Removed rows are left as holes until the next build.
+
+    Every patch method is idempotent, so a patch that lands after a build
+    already picked up the same rows is harmless.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        self.loaded = False
+        self.expires_at = None
+        self.version = None
+        # members
+        self.node_ids = []
+        self.nodes = {}
+        self.male = bytearray()
+        self.partner_of = []
+        self.other_of = []
+        self.other_with = []
+        self.child_of = []
+        self.mother_of = []
+        # spouse rows
+        self.family_ids = []
+        self.families = {}
+        self.husband = array("i")
+        self.wife = array("i")
+        self.family_children = []
+        self.family_others = []
+        # other spouse rows
+        self.other_ids = []
+        self.others = {}
+        self.other_member = array("i")
+        self.other_related = array("i")
+        self.other_family = array("i")
+        self.other_type = []
+        # child rows
+        self.child_ids = []
+        self.children = {}
+        self.child_member = array("i")
+        self.child_family = array("i")
+        self.child_mother = array("i")
+        self.child_type = []
+
+    def __contains__(self, member_id):
+        return member_id in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    # patches
+
+    def node(self, member_id):
+        # "" is how clients spell "no member", it must not become a node
+        if not member_id:
+            return NO_NODE
+        node = self.nodes.get(member_id)
+        if node is None:
+            node = len(self.node_ids)
+            self.nodes[member_id] = node
+            self.node_ids.append(member_id)
+            self.male.append(0)
+            self.partner_of.append([])
+            self.other_of.append([])
+            self.other_with.append([])
+            self.child_of.append([])
+            self.mother_of.append([])
+        return node
+
+    def family(self, family_id):
+        if not family_id:
+            return NO_NODE
+        family = self.families.get(family_id)
+        if family is None:
+            family = len(self.family_ids)
+            self.families[family_id] = family
+            self.family_ids.append(family_id)
+            self.husband.append(NO_NODE)
+            self.wife.append(NO_NODE)
+            self.family_children.append([])
+            self.family_others.append([])
+        return family
+
+    def add_member(self, member_id, male):
+        with self.lock:
+            self.male[self.node(member_id)] = bool(male)
+
+    def set_family(self, family_id, husband_id, wife_id):
+        with self.lock:
+            family = self.family(family_id)
+            for partners, member_id in (
+                (self.husband, husband_id),
+                (self.wife, wife_id),
+            ):
+                old, new = partners[family], self.node(member_id)
+                if old == new:
+                    continue
+                if old != NO_NODE:
+                    self.partner_of[old].remove(family)
+                if new != NO_NODE:
+                    insort(self.partner_of[new], family)
+                partners[family] = new
+
+    def add_other_spouse(
+        self, other_id, member_id, related_to, relationship_type, family_id
+    ):
+        with self.lock:
+            if other_id in self.others:
+                return
+            other = len(self.other_ids)
+            self.others[other_id] = other
+            self.other_ids.append(other_id)
+            member, related = self.node(member_id), self.node(related_to)
+            family = self.family(family_id)
+            self.other_member.append(member)
+            self.other_related.append(related)
+            self.other_family.append(family)
+            self.other_type.append(relationship_type)
+            if member != NO_NODE:
+                self.other_of[member].append(other)
+            if related != NO_NODE:
+                self.other_with[related].append(other)
+            if family != NO_NODE:
+                self.family_others[family].append(other)
+
+    def add_child(self, child_id, member_id, family_id, mother_id, child_type):
+        with self.lock:
+            if child_id in self.children:
+                return
+            child = len(self.child_ids)
+            self.children[child_id] = child
+            self.child_ids.append(child_id)
+            member, mother = self.node(member_id), self.node(mother_id)
+            family = self.family(family_id)
+            self.child_member.append(member)
+            self.child_family.append(family)
+            self.child_mother.append(mother)
+            self.child_type.append(child_type)
+            if member != NO_NODE:
+                self.child_of[member].append(child)
+            if family != NO_NODE:
+                self.family_children[family].append(child)
+            if mother != NO_NODE:
+                self.mother_of[mother].append(child)
+
+    def remove_other_spouse(self, other_id):
+        with self.lock:
+            other = self.others.pop(other_id, None)
+            if other is None:
+                return
+            for rows, node in (
+                (self.other_of, self.other_member[other]),
+                (self.other_with, self.other_related[other]),
+                (self.family_others, self.other_family[other]),
+            ):
+                if node != NO_NODE:
+                    rows[node].remove(other)
+            self.other_ids[other] = None
+
+    def remove_child(self, child_id):
+        with self.lock:
+            child = self.children.pop(child_id, None)
+            if child is None:
+                return
+            for rows, node in (
+                (self.child_of, self.child_member[child]),
+                (self.family_children, self.child_family[child]),
+                (self.mother_of, self.child_mother[child]),
+            ):
+                if node != NO_NODE:
+                    rows[node].remove(child)
+            self.child_ids[child] = None
+
+    # rows still pointing at a removed family are unlinked from it, the same
+    # way the delete nulls their spouse_id
+    def remove_family(self, family_id):
+        with self.lock:
+            family = self.families.pop(family_id, None)
+            if family is None:
+                return
+            for node in (self.husband[family], self.wife[family]):
+                if node != NO_NODE:
+                    self.partner_of[node].remove(family)
+            for child in self.family_children[family]:
+                self.child_family[child] = NO_NODE
+            for other in self.family_others[family]:
+                self.other_family[other] = NO_NODE
+            self.husband[family] = self.wife[family] = NO_NODE
+            self.family_children[family] = []
+            self.family_others[family] = []
+            self.family_ids[family] = None
+
+    def remove_member(self, member_id):
+        with self.lock:
+            node = self.nodes.pop(member_id, None)
+            if node is None:
+                return
+            for rows in (
+                self.partner_of,
+                self.other_of,
+                self.other_with,
+                self.child_of,
+                self.mother_of,
+            ):
+                rows[node] = []
+            self.node_ids[node] = None
+
+    def remove(self, members=(), families=(), children=(), other_spouses=()):
+        with self.lock:
+            for other_id in other_spouses:
+                self.remove_other_spouse(other_id)
+            for child_id in children:
+                self.remove_child(child_id)
+            for family_id in families:
+                self.remove_family(family_id)
+            for member_id in members:
+                self.remove_member(member_id)
+
+    def reset(self):
+        with self.lock:
+            self.clear()
+
+    def build(self, members, families, other_spouses, children, expires_at=None):
+        with self.lock:
+            self.clear()
+            for member_id, male in members:
+                self.add_member(member_id, male)
+            for row in families:
+                self.set_family(*row)
+            for row in other_spouses:
+                self.add_other_spouse(*row)
+            for row in children:
+                self.add_child(*row)
+            self.loaded = True
+            self.expires_at = expires_at
+
+    # members whose own rows a patch changes, looked up before it is
+    # applied; None when the patch is not limited to known members
+    def touched(self, method, *args):
+        if method == "add_member":
+            members, family_id = {args[0]}, None
+        elif method == "set_family":
+            family_id, husband_id, wife_id = args
+            members = {husband_id, wife_id}
+        elif method == "add_other_spouse":
+            _, member_id, related_to, _, family_id = args
+            members = {member_id, related_to}
+        elif method == "add_child":
+            _, member_id, family_id, mother_id, _ = args
+            members = {member_id, mother_id}
+        elif method == "remove_child":
+            child = self.children.get(args[0])
+            if child is None:
+                return set()
+            family = self.child_family[child]
+            members = {
+                self.member_id(self.child_member[child]),
+                self.member_id(self.child_mother[child]),
+            }
+            family_id = self.family_ids[family] if family != NO_NODE else None
+        elif method == "remove":
+            members, family_id = set(args[0]), None
+        else:
+            return None
+        members.update(self.family_partners(family_id) or ())
+        members.discard(None)
+        return members
+
+    # parents, children and partners of the given members
+    def neighbour_ids(self, member_ids):
+        found = set()
+        for member_id in member_ids:
+            node = self.nodes.get(member_id)
+            if node is not None:
+                found.update(
+                    self.node_ids[neighbour] for neighbour, _ in self.neighbours(node)
+                )
+        return found
+
+    # member level reads, in table order
+
+    def flags(self, member_id, male):
+        node = self.nodes.get(member_id)
+        if node is None:
+            return {"has_spouse": False, "only_child": False}
+        partners = self.husband if male else self.wife
+        other = self.wife if male else self.husband
+        has_spouse = False
+        for family in self.partner_of[node]:
+            if partners[family] == node:
+                has_spouse = other[family] != NO_NODE
+                break
+        only_child = bool(self.other_of[node]) or (
+            bool(self.partner_of[node]) and not male
+        )
+        return {"has_spouse": has_spouse, "only_child": only_child}
+
+    def member_id(self, node):
+        return self.node_ids[node] if node != NO_NODE else None
+
+    def spouse_family(self, member_id):
+        node = self.nodes.get(member_id)
+        if node is None or not self.partner_of[node]:
+            return None
+        return self.family_ids[self.partner_of[node][0]]
+
+    def family_partners(self, family_id):
+        family = self.families.get(family_id)
+        if family is None:
+            return None
+        return (
+            self.member_id(self.husband[family]),
+            self.member_id(self.wife[family]),
+        )
+
+    def family_child_ids(self, family_id, without_mother=False):
+        family = self.families.get(family_id)
+        if family is None:
+            return []
+        return [
+            self.member_id(self.child_member[child])
+            for child in self.family_children[family]
+            if not without_mother or self.child_mother[child] == NO_NODE
+        ]
+
+    def other_spouse_row(self, other):
+        return (
+            self.other_ids[other],
+            self.member_id(self.other_member[other]),
+            self.member_id(self.other_related[other]),
+            self.other_type[other],
+        )
+
+    def family_other_spouses(self, family_id):
+        family = self.families.get(family_id)
+        if family is None:
+            return []
+        return [self.other_spouse_row(other) for other in self.family_others[family]]
+
+    def parent_link(self, member_id):
+        node = self.nodes.get(member_id)
+        if node is None or not self.child_of[node]:
+            return None
+        child = self.child_of[node][0]
+        return (
+            (
+                self.family_ids[self.child_family[child]]
+                if self.child_family[child] != NO_NODE
+                else None
+            ),
+            self.member_id(self.child_mother[child]),
+        )
+
+    def other_spouse_links(self, member_id):
+        node = self.nodes.get(member_id)
+        if node is None:
+            return []
+        return [self.other_spouse_row(other) for other in self.other_of[node]]
+
+    def mothered_child_ids(self, member_id):
+        node = self.nodes.get(member_id)
+        if node is None:
+            return []
+        return [
+            self.member_id(self.child_member[child]) for child in self.mother_of[node]
+        ]
+
+    # every member get_family_chain can show for member_id
+    def family_chain_ids(self, member_id):
+        ids = {member_id}
+        parent_link = self.parent_link(member_id)
+        if parent_link:
+            family_id, mother_id = parent_link
+            ids.update(self.family_partners(family_id) or ())
+            ids.add(mother_id)
+        family_id = self.spouse_family(member_id)
+        if family_id:
+            ids.update(self.family_partners(family_id))
+            ids.update(self.family_child_ids(family_id))
+            for _, other_id, related_id, _ in self.family_other_spouses(family_id):
+                ids.update((other_id, related_id))
+        for _, other_id, related_id, _ in self.other_spouse_links(member_id):
+            ids.update((other_id, related_id))
+        ids.update(self.mothered_child_ids(member_id))
+        ids.discard(None)
+        return ids
+
+    # node level adjacency
+
+    # (parent, child_type) for every parent link of a node
+    def parent_links(self, node):
+        found = []
+        for child in self.child_of[node]:
+            family = self.child_family[child]
+            father = self.husband[family] if family != NO_NODE else NO_NODE
+            mother = self.child_mother[child]
+            if mother == NO_NODE and family != NO_NODE:
+                mother = self.wife[family]
+            found.extend(
+                (parent, self.child_type[child])
+                for parent in (father, mother)
+                if parent != NO_NODE
+            )
+        return found
+
+    def parents(self, node):
+        return [parent for parent, _ in self.parent_links(node)]
+
+    def children_of(self, node):
+        found = []
+        for family in self.partner_of[node]:
+            fathered = self.husband[family] == node
+            for child in self.family_children[family]:
+                mother = self.child_mother[child]
+                if fathered or mother in (NO_NODE, node):
+                    found.append(self.child_member[child])
+        for child in self.mother_of[node]:
+            if self.child_member[child] not in found:
+                found.append(self.child_member[child])
+        return found
+
+    def partners(self, node):
+        found = []
+        for family in self.partner_of[node]:
+            partner = (
+                self.wife[family]
+                if self.husband[family] == node
+                else self.husband[family]
+            )
+            if partner != NO_NODE:
+                found.append(partner)
+        found.extend(self.other_related[other] for other in self.other_of[node])
+        found.extend(self.other_member[other] for other in self.other_with[node])
+        return [partner for partner in found if partner != NO_NODE]
+
+    # relationship type of an OtherSpouse row where partner is the other
+    # spouse of node, None for Spouse partners
+    def partner_type(self, node, partner):
+        for other in self.other_with[node]:
+            if self.other_member[other] == partner:
+                return self.other_type[other]
+        return None
+
+    # generations from node up to each ancestor within max_depth, and the
+    # (child, child_type) link each ancestor was first reached through.
+    # follow decides which child types count as parent links
+    def ancestor_depths(self, node, max_depth, follow=None):
+        depths, via = {node: 0}, {node: None}
+        frontier = [node]
+        for depth in range(1, max_depth + 1):
+            reached = []
+            for current in frontier:
+                for parent, child_type in self.parent_links(current):
+                    if parent in depths or (follow and not follow(child_type)):
+                        continue
+                    depths[parent] = depth
+                    via[parent] = (current, child_type)
+                    reached.append(parent)
+            if not reached:
+                break
+            frontier = reached
+        return depths, via
+
+    # closest common ancestors of two nodes: every ancestor shared at the
+    # smallest (up, down) generation distance, with both walks so the path
+    # can be rebuilt. a pedigree gives each member two parents, so this is a
+    # bounded walk over both lines rather than a single-parent LCA table
+    def common_ancestors(self, node, other, max_depth, follow=None):
+        depths, via = self.ancestor_depths(node, max_depth, follow)
+        other_depths, other_via = self.ancestor_depths(other, max_depth, follow)
+        shared = depths.keys() & other_depths.keys()
+        if not shared:
+            return None
+        up, down = min(
+            ((depths[ancestor], other_depths[ancestor]) for ancestor in shared),
+            key=lambda pair: (sum(pair), pair),
+        )
+        ancestors = sorted(
+            ancestor
+            for ancestor in shared
+            if (depths[ancestor], other_depths[ancestor]) == (up, down)
+        )
+        return up, down, ancestors, via, other_via
+
+    def lineage(self, via, ancestor):
+        links = []
+        while via[ancestor]:
+            child, child_type = via[ancestor]
+            links.append((child, child_type))
+            ancestor = child
+        return links[::-1]
+
+    # neighbours of a node with what each one is to it
+    def neighbours(self, node):
+        for parent in self.parents(node):
+            yield parent, "parent"
+        for child in self.children_of(node):
+            yield child, "child"
+        for partner in self.partners(node):
+            yield partner, "partner"
+
+    # shortest chain of parent/child/partner links between two nodes, as
+    # (node, what it is to the previous node) pairs. the search runs from both
+    # ends, always expanding the smaller frontier, and gives up after
+    # max_hops links
+    def shortest_path(self, node, other, max_hops):
+        if node == other:
+            return [(node, None)]
+        sides = ({node: (None, None, 0)}, {other: (None, None, 0)})
+        frontiers = ([node], [other])
+        hops = 0
+        while frontiers[0] and frontiers[1] and hops < max_hops:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            visited, opposite = sides[side], sides[1 - side]
+            reached, meetings = [], []
+            for current in frontiers[side]:
+                depth = visited[current][2] + 1
+                for neighbour, link in self.neighbours(current):
+                    if neighbour in visited:
+                        continue
+                    visited[neighbour] = (current, link, depth)
+                    reached.append(neighbour)
+                    if neighbour in opposite:
+                        meetings.append(neighbour)
+            if meetings:
+                meeting = min(
+                    meetings, key=lambda met: sides[0][met][2] + sides[1][met][2]
+                )
+                return self.join_path(sides, meeting)
+            frontiers = (
+                (reached, frontiers[1]) if side == 0 else (frontiers[0], reached)
+            )
+            hops += 1
+        return None
+
+    def join_path(self, sides, meeting):
+        forward, backward = sides
+        path = []
+        current = meeting
+        while current is not None:
+            previous, link, _ = forward[current]
+            path.append((current, link))
+            current = previous
+        path.reverse()
+        current = meeting
+        while backward[current][0] is not None:
+            following, link, _ = backward[current]
+            path.append((following, INVERSE_LINKS[link]))
+            current = following
+        return path
+
+
+INVERSE_LINKS = {"parent": "child", "child": "parent", "partner": "partner"}
+
+ORDINALS = ["first", "second", "third", "fourth", "fifth", "sixth", "seventh"]
+
+REMOVALS = {1: "once", 2: "twice"}
+
+
+def ordinal(number):
+    return ORDINALS[number - 1] if number <= len(ORDINALS) else f"{number}th"
+
+
+def greats(count):
+    return "great-" * count
+
+
+# what a member `down` generations below the common ancestor is to a member
+# `up` generations below it, e.g. (2, 3) is a first cousin once removed
+def kinship_label(up, down, male, half=False):
+    if up == down == 0:
+        return "self"
+    if up == 0:
+        name = "son" if male else "daughter"
+        if down > 1:
+            name = greats(down - 2) + "grand" + name
+        return name
+    if down == 0:
+        name = "father" if male else "mother"
+        if up > 1:
+            name = greats(up - 2) + "grand" + name
+        return name
+    prefix = "half-" if half else ""
+    if up == down == 1:
+        return prefix + ("brother" if male else "sister")
+    if down == 1:
+        return greats(up - 2) + prefix + ("uncle" if male else "aunt")
+    if up == 1:
+        return greats(down - 2) + prefix + ("nephew" if male else "niece")
+    label = f"{prefix}{ordinal(min(up, down) - 1)} cousin"
+    removed = abs(up - down)
+    if removed:
+        label += f" {REMOVALS.get(removed, f'{removed} times')} removed"
+    return label
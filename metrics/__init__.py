@@ -0,0 +1,141 @@
+import os
+import time
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from query_stats import current_queries
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+# metric objects are process wide; under gunicorn every worker writes them
+# to mmap files in PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py)
+REQUESTS = Counter(
+    "http_requests_total",
+    "Requests handled, by route",
+    ["method", "endpoint", "status"],
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, by route",
+    ["method", "endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Size of the response body, by route",
+    ["method", "endpoint"],
+    buckets=SIZE_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL statements run per request, by route (needs QUERY_STATS_ENABLED)",
+    ["method", "endpoint"],
+    buckets=QUERY_BUCKETS,
+)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Database connections currently checked out of the pool",
+    multiprocess_mode="livesum",
+)
+POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Connections open beyond the pool size",
+    multiprocess_mode="livesum",
+)
+POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Configured size of the connection pool",
+    multiprocess_mode="livesum",
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Cache reads by key namespace; hit ratio is hit / (hit + miss)",
+    ["cache", "result"],
+)
+
+
+class Metrics:
+    """Prometheus metrics for every route, the connection pool and the cache,
+    served at /metrics in the text exposition format.
+
+    Off unless METRICS_ENABLED is set. When PROMETHEUS_MULTIPROC_DIR is set,
+    /metrics merges the files every worker writes.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.cache = None
+
+    # needs the sqlalchemy and cache extensions to be set up first
+    def init_app(self, app):
+        app.extensions["metrics"] = self
+        self.enabled = app.config.get("METRICS_ENABLED", False)
+        if not self.enabled:
+            return
+        self.cache = app.extensions.get("cache")
+        with app.app_context():
+            self.watch_pool(app.extensions["sqlalchemy"].engine)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.add_url_rule("/metrics", "metrics", self.expose)
+
+    def watch_pool(self, engine):
+        pool = engine.pool
+        if hasattr(pool, "size"):
+            POOL_SIZE.set(pool.size())
+
+        def set_overflow():
+            if hasattr(pool, "overflow"):
+                POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+        @event.listens_for(engine, "checkout")
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            POOL_CHECKED_OUT.inc()
+            set_overflow()
+
+        @event.listens_for(engine, "checkin")
+        def checkin(dbapi_connection, connection_record):
+            POOL_CHECKED_OUT.dec()
+            set_overflow()
+
+    def start_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def finish_request(self, response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        # routes, not raw paths, keep the label set bounded
+        endpoint = request.endpoint or "unmatched"
+        method = request.method
+        LATENCY.labels(method, endpoint).observe(time.perf_counter() - started)
+        REQUESTS.labels(method, endpoint, response.status_code).inc()
+        if not response.is_streamed:
+            RESPONSE_SIZE.labels(method, endpoint).observe(
+                response.calculate_content_length() or 0
+            )
+        queries = current_queries.get()
+        if queries is not None:
+            DB_QUERIES.labels(method, endpoint).observe(queries.count)
+        if self.cache is not None:
+            for (name, hit), count in self.cache.take_lookups().items():
+                CACHE_LOOKUPS.labels(name, "hit" if hit else "miss").inc(count)
+        return response
+
+    def expose(self):
+        registry = REGISTRY
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
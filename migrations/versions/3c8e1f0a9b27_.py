@@ -0,0 +1,62 @@
+"""add relationship and listing indexes
+
+Revision ID: 3c8e1f0a9b27
+Revises: f252d853f882
+Create Date: 2026-10-18 09:12:44.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8e1f0a9b27'
+down_revision = 'f252d853f882'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('member', schema=None) as batch_op:
+        batch_op.create_index('ix_member_created_at_id', ['created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('moderators', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_moderators_email'), ['email'], unique=False)
+        batch_op.create_index('ix_moderators_fullname_id', ['fullname', 'id'], unique=False)
+
+    with op.batch_alter_table('spouse', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_spouse_husband_id'), ['husband_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_spouse_wife_id'), ['wife_id'], unique=False)
+
+    with op.batch_alter_table('child', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_child_member_id'), ['member_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_child_mother_id'), ['mother_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_child_spouse_id'), ['spouse_id'], unique=False)
+
+    with op.batch_alter_table('other_spouse', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_other_spouse_member_id'), ['member_id'], unique=False)
+        batch_op.create_index('ix_other_spouse_member_related_to_member_id', ['member_related_to', 'member_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_other_spouse_spouse_id'), ['spouse_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('other_spouse', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_other_spouse_spouse_id'))
+        batch_op.drop_index('ix_other_spouse_member_related_to_member_id')
+        batch_op.drop_index(batch_op.f('ix_other_spouse_member_id'))
+
+    with op.batch_alter_table('child', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_child_spouse_id'))
+        batch_op.drop_index(batch_op.f('ix_child_mother_id'))
+        batch_op.drop_index(batch_op.f('ix_child_member_id'))
+
+    with op.batch_alter_table('spouse', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_spouse_wife_id'))
+        batch_op.drop_index(batch_op.f('ix_spouse_husband_id'))
+
+    with op.batch_alter_table('moderators', schema=None) as batch_op:
+        batch_op.drop_index('ix_moderators_fullname_id')
+        batch_op.drop_index(batch_op.f('ix_moderators_email'))
+
+    with op.batch_alter_table('member', schema=None) as batch_op:
+        batch_op.drop_index('ix_member_created_at_id')
@@ -1,13 +1,36 @@
-from extensions import db
+from extensions import db, cache
+from flask import has_request_context, request
 from enum import Enum
 from passlib.hash import pbkdf2_sha256 as hasher
 from sqlalchemy import Enum as SQLAlchemyEnum
 from sqlalchemy.ext.hybrid import hybrid_property
 import re
+import json
+import random
+import threading
+import time
+import hashlib
+from collections import namedtuple
 import datetime
-from utils import hex_uuid, extract_public_id
+from utils import hex_uuid, extract_public_id, encode_cursor
 import pprint
-from sqlalchemy.orm import configure_mappers, mapper, foreign
+from sqlalchemy.orm import configure_mappers, mapper, foreign, Session
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql
+from kinship import KinshipGraph, kinship_label
+from search import (
+    MAX_TOKEN_LENGTH,
+    EXACT_MATCH_BONUS,
+    PHONETIC_KEY_LENGTH,
+    search_rows,
+    prefix_end,
+    query_words,
+    tokenize,
+    phonetic_key,
+    phonetic_stem,
+    edit_distance,
+    PrefixIndex,
+)
 
 # from datetime import datetime
 from datetime import datetime, timedelta, date
@@ -43,8 +66,17 @@ class Status(Enum):
     deceased = "Deceased"
 
 
+# columns read with range scans have to sort by code point; MySQL's default
+# collation orders and equates characters by their accent-free letter
+def binary_string(length):
+    return db.String(length).with_variant(
+        mysql.VARCHAR(length, collation="utf8mb4_bin"), "mysql"
+    )
+
+
 class Member(db.Model):
     __tablename__ = "member"
+    __table_args__ = (db.Index("ix_member_created_at_id", "created_at", "id"),)
     id = db.Column(db.String(50), primary_key=True, default=hex_uuid)
     first_name = db.Column(db.String(50), nullable=True)
     last_name = db.Column(db.String(50), nullable=True)
@@ -58,7 +90,11 @@ class Member(db.Model):
     birth_place = db.Column(db.String(150), nullable=True)
     birth_name = db.Column(db.String(150), nullable=True)
     story_line = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    first_name_key = db.Column(binary_string(PHONETIC_KEY_LENGTH), index=True)
+    last_name_key = db.Column(binary_string(PHONETIC_KEY_LENGTH), index=True)
+    created_at = db.Column(
+        db.DateTime, default=datetime.now, server_default=db.func.now()
+    )
     updated_at = db.Column(
         db.DateTime, server_default=db.func.now(), server_onupdate=db.func.now()
     )
@@ -152,6 +188,9 @@ class Member(db.Model):
         birth_place=None,
         birth_name=None,
     ):
+        # ids are assigned up front so related rows can reference a member
+        # before the session is flushed
+        self.id = hex_uuid()
         self.first_name = first_name.lower()
         self.last_name = last_name.lower()
         self.gender = Gender(gender.title())
@@ -164,7 +203,13 @@ class Member(db.Model):
         self.birth_name = birth_name
         self.birth_place = birth_place
 
-    def to_dict(self):
+    def to_dict(self, flags=None):
+        # flags are precomputed by members_to_dict for list endpoints
+        if flags is None:
+            flags = {
+                "has_spouse": has_spouse(self.id, self.gender.value),
+                "only_child": only_child_create(self),
+            }
         member_dict = {
             "id": self.id,
             "first_name": self.first_name.title(),
@@ -182,8 +227,8 @@ class Member(db.Model):
             "birth_name": self.birth_name,
             "birth_place": self.birth_place,
             "story_line": self.story_line,
-            "has_spouse": has_spouse(self.id, self.gender.value),
-            "only_child": only_child_create(self),
+            "has_spouse": flags["has_spouse"],
+            "only_child": flags["only_child"],
         }
         return member_dict
         # return {key: value for key, value in member_dict.items() if value}
@@ -234,6 +279,8 @@ class Logo(db.Model):
     hero_text = db.Column(db.Text, nullable=True)
     directory_image = db.Column(db.Text, nullable=True)
     clan_name = db.Column(db.String(50), nullable=True)
+    # bumped on every edit so workers can tell their copy is stale
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
 
     def __init__(
         self,
@@ -274,9 +321,10 @@ class Logo(db.Model):
 
 class Moderators(db.Model):
     __tablename__ = "moderators"
+    __table_args__ = (db.Index("ix_moderators_fullname_id", "fullname", "id"),)
     id = db.Column(db.String(50), primary_key=True, default=hex_uuid)
     fullname = db.Column(db.String(150), nullable=False)
-    email = db.Column(db.String(50), nullable=False)
+    email = db.Column(db.String(50), nullable=False, index=True)
     is_super_admin = db.Column(db.Boolean, default=False)
     role = db.Column(db.String(50), default="moderator")
     password = db.Column(db.Text, nullable=False)
@@ -326,8 +374,8 @@ class ModSession(db.Model):
 class Spouse(db.Model):
     __tablename__ = "spouse"
     id = db.Column(db.String(50), primary_key=True, default=hex_uuid)
-    husband_id = db.Column(db.String(50), db.ForeignKey("member.id"))
-    wife_id = db.Column(db.String(50), db.ForeignKey("member.id"))
+    husband_id = db.Column(db.String(50), db.ForeignKey("member.id"), index=True)
+    wife_id = db.Column(db.String(50), db.ForeignKey("member.id"), index=True)
     other_spouses = db.relationship("OtherSpouse", backref="spouse", lazy=True)
     children = db.relationship("Child", backref="spouse", lazy=True)
     husband = db.relationship(
@@ -376,11 +424,18 @@ class Spouse(db.Model):
 
 class OtherSpouse(db.Model):
     __tablename__ = "other_spouse"
+    __table_args__ = (
+        db.Index(
+            "ix_other_spouse_member_related_to_member_id",
+            "member_related_to",
+            "member_id",
+        ),
+    )
     id = db.Column(db.String(50), primary_key=True, default=hex_uuid)
-    member_id = db.Column(db.String(50), db.ForeignKey("member.id"))
+    member_id = db.Column(db.String(50), db.ForeignKey("member.id"), index=True)
     member_related_to = db.Column(db.String(50), db.ForeignKey("member.id"))
     relationship_type = db.Column(SQLAlchemyEnum(RelationshipType))
-    spouse_id = db.Column(db.String(50), db.ForeignKey("spouse.id"))
+    spouse_id = db.Column(db.String(50), db.ForeignKey("spouse.id"), index=True)
 
     member = db.relationship(
         "Member",
@@ -415,9 +470,11 @@ class OtherSpouse(db.Model):
 class Child(db.Model):
     __tablename__ = "child"
     id = db.Column(db.String(50), primary_key=True, default=hex_uuid)
-    member_id = db.Column(db.String(50), db.ForeignKey("member.id"))
-    spouse_id = db.Column(db.String(50), db.ForeignKey("spouse.id"))
-    mother_id = db.Column(db.String(50), db.ForeignKey("member.id"), nullable=True)
+    member_id = db.Column(db.String(50), db.ForeignKey("member.id"), index=True)
+    spouse_id = db.Column(db.String(50), db.ForeignKey("spouse.id"), index=True)
+    mother_id = db.Column(
+        db.String(50), db.ForeignKey("member.id"), nullable=True, index=True
+    )
     child_type = db.Column(SQLAlchemyEnum(ChildType))
 
     def to_dict(self):
@@ -432,6 +489,33 @@ class Child(db.Model):
         }
 
 
+# one row per (token, member, field); the primary key leads with the token
+# so a prefix search is a range scan over the clustered index
+class MemberSearch(db.Model):
+    __tablename__ = "member_search"
+    token = db.Column(binary_string(MAX_TOKEN_LENGTH), primary_key=True)
+    member_id = db.Column(
+        db.String(50), db.ForeignKey("member.id"), primary_key=True, index=True
+    )
+    field = db.Column(db.String(20), primary_key=True)
+    weight = db.Column(db.Integer, nullable=False, default=1)
+
+    member = db.relationship("Member")
+
+
+# every commit that changes the family tables logs the patches it made, so
+# each worker can bring its in-process copies (kinship graph, suggest index,
+# cached member views) up to date from the database instead of from a
+# counter that only lives in the process that made the write
+class TreeChange(db.Model):
+    __tablename__ = "tree_change"
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.now, index=True
+    )
+    patches = db.Column(db.Text, nullable=False)
+
+
 def create_mod(email, password, fullname, role, is_super_admin=False):
     mod = Moderators(
         email=email,
@@ -445,33 +529,339 @@ def create_mod(email, password, fullname, role, is_super_admin=False):
     return mod
 
 
-def has_spouse(member_id, gender):
-    print("member_id", member_id, "gender", gender)
-    if gender == "Male":
-        print("This is a male")
-        # filter husband id
-        spouse = Spouse.query.filter_by(husband_id=member_id).first()
-        if not spouse:
-            return False
-        return True if spouse.wife_id else False
-    elif gender == "Female":
-        print("This is a female")
-        # filter wife id
-        spouse = Spouse.query.filter_by(wife_id=member_id).first()
-        if not spouse:
-            return False
-        return True if spouse.husband_id else False
-    return False
+# a missing change id that stays missing this long belonged to a write that
+# rolled back; a worker that has not synced for half the retention starts
+# over from the tables
+TREE_CHANGE_GAP_TIMEOUT = 60
+TREE_CHANGE_RETENTION = 3600
+TREE_CHANGE_PRUNE_RATE = 0.01
+TREE_SYNCED = "familytree.tree_synced"
+PATCH_QUEUES = {"graph": "kinship_patches", "suggest": "suggest_patches"}
+PATCH_ENUMS = {"add_other_spouse": (3, RelationshipType), "add_child": (4, ChildType)}
 
 
-# get spouse details
-def get_spouse_details(member_id):
-    spouse = Spouse.query.filter(
-        db.or_(Spouse.husband_id == member_id, Spouse.wife_id == member_id)
-    ).first()
-    if spouse:
-        return spouse.to_dict(member_id), spouse
-    return {}, spouse
+class TreeChangeCursor:
+    """How far this process has applied the tree_change log.
+
+    `floor` is the last id below which every change has been applied or
+    given up on; ids above it that were already applied are kept in
+    `applied`, because ids are handed out at insert and commit in another
+    order.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.floor = None
+        self.applied = set()
+        self.gap_since = None
+        self.synced_at = 0.0
+
+
+tree_changes = TreeChangeCursor()
+
+
+# enums by name, id sets as lists
+def patch_value(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return value.name
+
+
+@event.listens_for(Session, "before_commit")
+def log_tree_change(session):
+    patches = {
+        name: session.info.pop(key)
+        for name, key in PATCH_QUEUES.items()
+        if session.info.get(key)
+    }
+    if not patches:
+        return
+    session.execute(
+        db.insert(TreeChange).values(
+            created_at=datetime.now(),
+            patches=json.dumps(patches, default=patch_value),
+        )
+    )
+    if random.random() < TREE_CHANGE_PRUNE_RATE:
+        session.execute(
+            db.delete(TreeChange).where(
+                TreeChange.created_at
+                < datetime.now() - timedelta(seconds=TREE_CHANGE_RETENTION)
+            )
+        )
+    # reads later in the same request have to see this write
+    if has_request_context():
+        request.environ.pop(TREE_SYNCED, None)
+
+
+def decode_patch(method, args):
+    if method in PATCH_ENUMS:
+        position, enum = PATCH_ENUMS[method]
+        value = args[position]
+        if value is not None and not isinstance(value, enum):
+            args[position] = enum[value] if value in enum.__members__ else enum(value)
+    return method, args
+
+
+# applies the changes other workers (and this one) committed since the last
+# sync; once per request, since every read in it shares one snapshot
+def sync_tree_changes():
+    if has_request_context():
+        if request.environ.get(TREE_SYNCED):
+            return
+        request.environ[TREE_SYNCED] = True
+    cursor = tree_changes
+    with cursor.lock:
+        now = time.monotonic()
+        if cursor.floor is None or now - cursor.synced_at > TREE_CHANGE_RETENTION / 2:
+            restart_tree_changes(cursor)
+            cursor.synced_at = now
+            return
+        cursor.synced_at = now
+        rows = db.session.execute(
+            db.select(TreeChange.id, TreeChange.patches)
+            .where(TreeChange.id > cursor.floor)
+            .order_by(TreeChange.id)
+        ).all()
+        for row in rows:
+            if row.id not in cursor.applied:
+                apply_tree_change(json.loads(row.patches))
+                cursor.applied.add(row.id)
+        advance_tree_changes(cursor, now)
+
+
+def advance_tree_changes(cursor, now):
+    while cursor.applied:
+        following = min(cursor.applied)
+        if following != cursor.floor + 1:
+            # wait for the missing ids to commit, or give up on them
+            if cursor.gap_since is None or cursor.gap_since[0] != cursor.floor:
+                cursor.gap_since = (cursor.floor, now)
+            if now - cursor.gap_since[1] < TREE_CHANGE_GAP_TIMEOUT:
+                return
+        cursor.applied.remove(following)
+        cursor.floor = following
+        cursor.gap_since = None
+
+
+# drops every in-process copy; they reload from the tables, which already
+# hold every change up to the new floor
+def restart_tree_changes(cursor):
+    cursor.floor = db.session.scalar(db.select(db.func.max(TreeChange.id))) or 0
+    cursor.applied.clear()
+    cursor.gap_since = None
+    kinship_graph.reset()
+    suggest_index.reset()
+    cache.bump_version("tree")
+
+
+def apply_tree_change(patches):
+    if "graph" in patches:
+        apply_graph_patches(
+            [decode_patch(method, args) for method, args in patches["graph"]]
+        )
+    if "suggest" in patches:
+        apply_suggest_patches(patches["suggest"])
+
+
+KINSHIP_GRAPH_TTL = 300
+kinship_graph = KinshipGraph()
+
+
+# the relationship reads are served from an in-process kinship graph, kept
+# current by replaying the tree_change log; the rebuild every
+# KINSHIP_GRAPH_TTL seconds is a safety net
+def get_kinship_graph(refresh=False):
+    sync_tree_changes()
+    graph = kinship_graph
+    if refresh or graph_is_stale(graph):
+        with graph.lock:
+            if refresh or graph_is_stale(graph):
+                load_kinship_graph(graph)
+    return graph
+
+
+def graph_is_stale(graph):
+    return not graph.loaded or graph.expires_at < datetime.now()
+
+
+def load_kinship_graph(graph):
+    members = db.session.execute(
+        db.select(Member.id, Member.gender == Gender.male)
+    ).all()
+    families = db.session.execute(
+        db.select(Spouse.id, Spouse.husband_id, Spouse.wife_id)
+    ).all()
+    other_spouses = db.session.execute(
+        db.select(
+            OtherSpouse.id,
+            OtherSpouse.member_id,
+            OtherSpouse.member_related_to,
+            OtherSpouse.relationship_type,
+            OtherSpouse.spouse_id,
+        )
+    ).all()
+    children = db.session.execute(
+        db.select(
+            Child.id,
+            Child.member_id,
+            Child.spouse_id,
+            Child.mother_id,
+            Child.child_type,
+        )
+    ).all()
+    graph.build(
+        members,
+        families,
+        other_spouses,
+        children,
+        expires_at=datetime.now() + timedelta(seconds=KINSHIP_GRAPH_TTL),
+    )
+
+
+# graph patches are queued on the session and logged when the transaction
+# commits, so a rolled back family unit never reaches the graph
+def queue_graph_patch(method, *args):
+    db.session.info.setdefault("kinship_patches", []).append((method, args))
+
+
+def apply_graph_patches(patches):
+    graph = kinship_graph
+    # cached family chains of the members a patch touches and of their
+    # neighbours, before and after it, are dropped; anything wider bumps the
+    # tree version instead
+    affected, whole_tree = set(), not graph.loaded
+    with graph.lock:
+        for method, args in patches:
+            touched = None if whole_tree else graph.touched(method, *args)
+            whole_tree = whole_tree or touched is None
+            if not whole_tree:
+                affected |= touched | graph.neighbour_ids(touched)
+            if graph.loaded:
+                getattr(graph, method)(*args)
+            if not whole_tree:
+                affected |= graph.neighbour_ids(touched)
+    if whole_tree:
+        cache.bump_version("tree")
+    else:
+        invalidate_members(affected)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_graph_patches(session, previous_transaction):
+    session.info.pop("kinship_patches", None)
+
+
+SUGGEST_INDEX_TTL = 300
+SUGGEST_FIELDS = ("first_name", "last_name", "birth_name")
+suggest_index = PrefixIndex()
+
+
+# the member picker's autocomplete index, kept current from the
+# tree_change log the same way as the kinship graph
+def get_suggest_index():
+    sync_tree_changes()
+    index = suggest_index
+    if graph_is_stale(index):
+        with index.lock:
+            if graph_is_stale(index):
+                load_suggest_index(index)
+    return index
+
+
+def load_suggest_index(index):
+    members = db.session.execute(
+        db.select(
+            Member.id, Member.gender, *(getattr(Member, f) for f in SUGGEST_FIELDS)
+        )
+    ).all()
+    index.build(
+        ((member.id, *suggest_entry(member)) for member in members),
+        expires_at=datetime.now() + timedelta(seconds=SUGGEST_INDEX_TTL),
+    )
+
+
+# terms and the to_dict2 payload of a member or member row
+def suggest_entry(member):
+    terms = []
+    for field in SUGGEST_FIELDS:
+        terms.extend(t for t in tokenize(getattr(member, field)) if t not in terms)
+    gender = member.gender
+    if not isinstance(gender, Gender):
+        gender = Gender(gender.title())
+    payload = {
+        "id": member.id,
+        "first_name": (member.first_name or "").title(),
+        "last_name": (member.last_name or "").title(),
+        "gender": gender.value,
+    }
+    return tuple(terms), payload
+
+
+def queue_suggest_patch(method, *args):
+    db.session.info.setdefault("suggest_patches", []).append((method, args))
+
+
+def apply_suggest_patches(patches):
+    index = suggest_index
+    with index.lock:
+        if index.loaded:
+            for method, args in patches:
+                getattr(index, method)(*args)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_suggest_patches(session, previous_transaction):
+    session.info.pop("suggest_patches", None)
+
+
+def suggest_members(q, limit):
+    return get_suggest_index().suggest(query_words(q), limit)
+
+
+def has_spouse(member_id, gender):
+    if gender not in (Gender.male.value, Gender.female.value):
+        return False
+    graph = get_kinship_graph()
+    return graph.flags(member_id, gender == Gender.male.value)["has_spouse"]
+
+
+# resolve has_spouse / only_child for a whole page of members at once
+def get_members_flags(members):
+    graph = get_kinship_graph()
+    return {
+        member.id: graph.flags(member.id, member.gender == Gender.male)
+        for member in members
+    }
+
+
+def members_to_dict(members):
+    flags = get_members_flags(members)
+    return [member.to_dict(flags[member.id]) for member in members]
+
+
+# spouse details as Spouse.to_dict(member_id) renders them, from the graph
+def get_spouse_details(graph, family_id, member_id, members):
+    husband_id, wife_id = graph.family_partners(family_id)
+    other_spouses = graph.family_other_spouses(family_id)
+    return_dict = {
+        "id": family_id,
+        "husband": member_to_dict(members, husband_id) or {},
+        "wife": member_to_dict(members, wife_id) or {},
+    }
+    if other_spouses and member_id == other_spouses[0][2]:
+        return_dict["other_spouses"] = [
+            {
+                "id": other_id,
+                "relationship_type": relationship_type.value,
+                "member": member_to_dict(members, other_member_id),
+                "related_member": member_to_dict(members, related_to),
+            }
+            for other_id, other_member_id, related_to, relationship_type in (
+                other_spouses
+            )
+        ]
+    return {key: value for key, value in return_dict.items() if value}
 
 
 def save_member(payload):
@@ -497,11 +887,44 @@ def save_member(payload):
     )
 
     db.session.add(member)
-    db.session.commit()
+    set_name_keys(member)
+    index_member_search(member)
+    queue_suggest_patch("add", member.id, *suggest_entry(member))
+    queue_graph_patch("add_member", member.id, member.gender == Gender.male)
     return member
 
 
+def set_name_keys(member):
+    member.first_name_key = phonetic_key(member.first_name)
+    member.last_name_key = phonetic_key(member.last_name)
+
+
+# search rows are rebuilt from the member's current values
+def index_member_search(member, replace=False):
+    if replace:
+        db.session.execute(
+            db.delete(MemberSearch).where(MemberSearch.member_id == member.id)
+        )
+    for row in search_rows(member.id, member):
+        db.session.add(MemberSearch(member=member, **row))
+
+
+# the save_* helpers only add rows to the session; create_member_with_spouse
+# and edit_member commit the whole family unit once at the end
 def create_member_with_spouse(data):
+    try:
+        res, err = add_member_with_spouse(data)
+        if err:
+            db.session.rollback()
+            return res, err
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return res, err
+
+
+def add_member_with_spouse(data):
     member = save_member(data)
     print(member.gender == Gender.male, "this is gender")
     if member.gender == Gender.female:
@@ -558,16 +981,10 @@ def save_spouse_details(husband_id, wife_id, other_spouses, children):
         else:
             print("creating new spouse")
             # Create a new Spouse record if neither exists
-            spouse = Spouse(husband_id=husband_id, wife_id=wife_id)
+            spouse = Spouse(id=hex_uuid(), husband_id=husband_id, wife_id=wife_id)
             db.session.add(spouse)
+    queue_graph_patch("set_family", spouse.id, spouse.husband_id, spouse.wife_id)
 
-        # Commit the changes to the database
-    try:
-        db.session.commit()
-    except Exception as e:
-        print(e, "error from save_spouse_details")
-        db.session.rollback()
-        return False
     if other_spouses:
         for other_spouse in other_spouses:
             member = save_member(other_spouse)
@@ -595,25 +1012,39 @@ def save_spouse_details(husband_id, wife_id, other_spouses, children):
 
 def save_other_spouses(member_id, member_related_to, relationship_type, spouse_id):
     other_spouse = OtherSpouse(
+        id=hex_uuid(),
         member_id=member_id,
         member_related_to=member_related_to,
         relationship_type=RelationshipType(relationship_type.title()),
         spouse_id=spouse_id,
     )
     db.session.add(other_spouse)
-    db.session.commit()
+    queue_graph_patch(
+        "add_other_spouse",
+        other_spouse.id,
+        member_id,
+        member_related_to,
+        other_spouse.relationship_type,
+        spouse_id,
+    )
     return other_spouse
 
 
+# clients send "" for "no other-spouse mother"; it is stored as NULL, which
+# is what the parent lookups, the lineage edges and the graph check for
 def save_child(member_id, spouse_id, child_type, mother_id):
+    mother_id = mother_id or None
     child = Child(
+        id=hex_uuid(),
         member_id=member_id,
         spouse_id=spouse_id,
         child_type=ChildType(child_type.title()),
         mother_id=mother_id,
     )
     db.session.add(child)
-    db.session.commit()
+    queue_graph_patch(
+        "add_child", child.id, member_id, spouse_id, mother_id, child.child_type
+    )
     return child
 
 
@@ -621,18 +1052,40 @@ def edit_child(child_id, payload, remove=False):
     child = Child.query.filter_by(id=child_id).first()
     if not child:
         return False
+    queue_graph_patch("remove_child", child.id)
     if remove:
         db.session.delete(child)
     else:
         child.spouse_id = payload.get("spouse_id") or child.spouse_id
         child.member_id = payload.get("member_id") or child.member_id
         child.child_type = payload.get("child_type") or child.child_type
+        queue_graph_patch(
+            "add_child",
+            child.id,
+            child.member_id,
+            child.spouse_id,
+            child.mother_id,
+            child.child_type,
+        )
     db.session.commit()
     return child
 
 
 # update member
 def edit_member(member_id, payload):
+    try:
+        err = update_member_details(member_id, payload)
+        if err:
+            db.session.rollback()
+            return err
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return err
+
+
+def update_member_details(member_id, payload):
     pprint.pprint(payload)
     member = Member.query.filter_by(id=member_id).first()
     if not member:
@@ -647,8 +1100,13 @@ def edit_member(member_id, payload):
     member.occupation = payload.get("occupation") or member.occupation
     member.birth_place = payload.get("birth_place") or member.birth_place
     member.birth_name = payload.get("birth_name") or member.birth_name
-    member.gender = payload.get("gender") or member.gender
+    if payload.get("gender"):
+        member.gender = Gender(payload["gender"].title())
     member.story_line = payload.get("story_line") or member.story_line
+    set_name_keys(member)
+    index_member_search(member, replace=True)
+    queue_suggest_patch("add", member.id, *suggest_entry(member))
+    queue_graph_patch("add_member", member.id, member.gender == Gender.male)
 
     if payload.get("spouse"):
         sec_mem = save_member(payload.get("spouse"))
@@ -660,9 +1118,11 @@ def edit_member(member_id, payload):
             wife_id = member.id
             husband_id = sec_mem.id
             # print("this is male", wife_id, husband_id)
-        save_spouse_details(
+        _, err = save_spouse_details(
             husband_id, wife_id, payload.get("other_spouses"), payload.get("children")
         )
+        if err:
+            return err
     spouse = (
         Spouse.query.filter_by(husband_id=member.id).first()
         or Spouse.query.filter_by(wife_id=member.id).first()
@@ -696,7 +1156,6 @@ def edit_member(member_id, payload):
             child_member = save_member(child)
             mother_id = None if child.get("mother_id") == "" else child["mother_id"]
             save_child(child_member.id, spouse.id, child["child_type"], mother_id)
-    db.session.commit()
     return None
 
 
@@ -707,16 +1166,10 @@ def get_spouse_related_to_other_spouse(member_related_to):
     return spouse
 
 
-def get_children(spouse_id, spouse_inst, member_id):
-    children = Child.query.filter_by(spouse_id=spouse_id).all()
-    if spouse_inst.wife_id == member_id:
-        print("spouse is wife and member")
-        all_children = [
-            child.to_dict() for child in children if child.mother_id is None
-        ]
-    else:
-        all_children = [child.to_dict() for child in children]
-    return all_children
+def get_children(graph, family_id, member_id, members):
+    _, wife_id = graph.family_partners(family_id)
+    child_ids = graph.family_child_ids(family_id, without_mother=wife_id == member_id)
+    return [member_to_dict(members, child_id) for child_id in child_ids]
 
 
 def get_children2(spouse_id):
@@ -730,59 +1183,73 @@ def get_other_spouses(spouse_id):
     return all_other_spouses
 
 
-def get_parents(spouse_id, child_mother_id):
-    parents = Spouse.query.filter_by(id=spouse_id).first()
-    if parents:
-        if child_mother_id:
-            mother = Member.query.filter_by(id=child_mother_id).first()
-            return {"father": parents.husband.to_dict(), "mother": mother.to_dict()}
-        return {"father": parents.husband.to_dict(), "mother": parents.wife.to_dict()}
-    return None
-
-
-def get_related_spouse(member_id, member_relate_id):
-    spouse = OtherSpouse.query.filter_by(
-        member_related_to=member_relate_id, member_id=member_id
-    ).first()
-    if spouse:
-        return (
-            {
-                "husband": spouse.related_member.to_dict(),
-                "wife": spouse.member.to_dict(),
-            }
-            if spouse.member.gender == Gender.female
-            else {
-                "husband": spouse.member.to_dict(),
-                "wife": spouse.related_member.to_dict(),
-            }
-        )
+def get_parents(graph, family_id, child_mother_id, members):
+    if not family_id or not graph.family_partners(family_id):
+        return None
+    husband_id, wife_id = graph.family_partners(family_id)
+    return {
+        "father": member_to_dict(members, husband_id),
+        "mother": member_to_dict(members, child_mother_id or wife_id),
+    }
+
+
+def get_related_spouse(graph, member_id, member_relate_id, members):
+    for _, other_member_id, related_to, _ in graph.other_spouse_links(member_id):
+        if related_to != member_relate_id:
+            continue
+        spouse = {
+            "husband": member_to_dict(members, related_to),
+            "wife": member_to_dict(members, other_member_id),
+        }
+        if members[other_member_id].gender != Gender.female:
+            spouse = {"husband": spouse["wife"], "wife": spouse["husband"]}
+        return spouse
     return {}
 
 
 def only_child_create(member):
-    if member.other_spouses:
-        return True
-    if member.spouse and member.gender == Gender.female:
-        return True
-    return False
+    graph = get_kinship_graph()
+    return graph.flags(member.id, member.gender == Gender.male)["only_child"]
+
+
+# every member the chain shows is loaded in one query, and their flags come
+# from the graph
+def load_members(member_ids):
+    return {
+        member.id: member
+        for member in Member.query.filter(Member.id.in_(member_ids)).all()
+    }
+
+
+def member_to_dict(members, member_id):
+    member = members.get(member_id)
+    return member.to_dict() if member else None
 
 
 def get_family_chain(member_id):
-    member = Member.query.filter_by(id=member_id).first()
+    graph = get_kinship_graph()
+    members = load_members(graph.family_chain_ids(member_id))
+    if member_id in members and member_id not in graph:
+        # written by another worker since the graph was built
+        graph = get_kinship_graph(refresh=True)
+        members = load_members(graph.family_chain_ids(member_id))
+    member = members.get(member_id)
     if not member:
         return None
     family_chain = {}
     # check if member has parents/ he's a child
-    if member.child:
-        parent = get_parents(member.child.spouse_id, member.child.mother_id)
+    parent_link = graph.parent_link(member_id)
+    if parent_link:
+        family_id, mother_id = parent_link
+        parent = get_parents(graph, family_id, mother_id, members)
         family_chain["parents"] = parent
         family_chain["child"] = member.to_dict()
 
     # get spouse details
-    if member.spouse:
-        print("gotten")
-        spouse, spouse_inst = get_spouse_details(member_id)
-        children = get_children(spouse["id"], spouse_inst, member_id)
+    family_id = graph.spouse_family(member_id)
+    if family_id:
+        spouse = get_spouse_details(graph, family_id, member_id, members)
+        children = get_children(graph, family_id, member_id, members)
         family_chain["spouse"] = spouse
         family_chain["children"] = children
 
@@ -790,19 +1257,406 @@ def get_family_chain(member_id):
         if "child" in family_chain:
             del family_chain["child"]
 
-    if member.other_spouses:
-        spouse = get_related_spouse(
-            member_id, member.other_spouses[0].member_related_to
-        )
+    other_spouses = graph.other_spouse_links(member_id)
+    if other_spouses:
+        spouse = get_related_spouse(graph, member_id, other_spouses[0][2], members)
         family_chain["spouse"] = spouse
-        family_chain["children"] = get_other_spouse_children(member_id)
+        family_chain["children"] = get_other_spouse_children(graph, member_id, members)
 
     return family_chain
 
 
-def get_other_spouse_children(member_id):
-    other_spouse_children = Child.query.filter_by(mother_id=member_id).all()
-    return [child.to_dict() for child in other_spouse_children]
+VIEW_CACHE_TTL = 300
+MEMBER_VIEWS = ("member", "fam-member")
+
+
+def view_etag(data):
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+# read models are cached together with the ETag of their content, so a
+# client holding the current version gets a 304 without any query
+def get_cached_view(key, loader, ttl=VIEW_CACHE_TTL):
+    entry = cache.get(key)
+    if entry is None:
+        data = loader()
+        if data is None:
+            return None, None
+        entry = {"etag": view_etag(data), "data": data}
+        cache.set(key, entry, ttl)
+    return entry["data"], entry["etag"]
+
+
+def member_cache_key(view, member_id):
+    return f"{view}:{cache.version('tree')}:{member_id}"
+
+
+# member views are cached under the current tree version; replaying the
+# tree_change log drops the members a write touches and their neighbours, so
+# the log is synced before every cached read
+def get_cached_family_chain(member_id):
+    sync_tree_changes()
+    return get_cached_view(
+        member_cache_key("member", member_id), lambda: get_family_chain(member_id)
+    )
+
+
+def get_fam_member_view(member_id):
+    member = get_one_fam_member(member_id)
+    if not member:
+        return None
+    return {**member, "other_spouse_list": get_members_other_spouses(member_id)}
+
+
+def get_cached_fam_member(member_id):
+    sync_tree_changes()
+    return get_cached_view(
+        member_cache_key("fam-member", member_id),
+        lambda: get_fam_member_view(member_id),
+    )
+
+
+def invalidate_members(member_ids):
+    cache.delete(
+        *(
+            member_cache_key(view, member_id)
+            for view in MEMBER_VIEWS
+            for member_id in member_ids
+        )
+    )
+
+
+def get_other_spouse_children(graph, member_id, members):
+    child_ids = graph.mothered_child_ids(member_id)
+    return [member_to_dict(members, child_id) for child_id in child_ids]
+
+
+MAX_TREE_DEPTH = 25
+PARTNER_RELATIONS = ("spouse", "other_spouse")
+
+
+# every parent -> child link as (parent_id, child_id, child_type):
+# fathers through spouse.husband_id, wives only for children without an
+# other-spouse mother, and other-spouse mothers through child.mother_id
+def parent_child_edges():
+    by_father = (
+        db.select(
+            Spouse.husband_id.label("parent_id"),
+            Child.member_id.label("child_id"),
+            Child.child_type.label("child_type"),
+        )
+        .select_from(Child)
+        .join(Spouse, Spouse.id == Child.spouse_id)
+        .where(Spouse.husband_id.isnot(None))
+    )
+    by_wife = (
+        db.select(Spouse.wife_id, Child.member_id, Child.child_type)
+        .select_from(Child)
+        .join(Spouse, Spouse.id == Child.spouse_id)
+        .where(Spouse.wife_id.isnot(None), Child.mother_id.is_(None))
+    )
+    by_mother = db.select(Child.mother_id, Child.member_id, Child.child_type).where(
+        Child.mother_id.isnot(None)
+    )
+    return db.union_all(by_father, by_wife, by_mother).subquery("edges")
+
+
+def tree_entry(member, depth, relation, related_to, kind=None, link_key="parent_id"):
+    entry = {**member.to_dict2(), "depth": depth, "relation": relation}
+    if relation in PARTNER_RELATIONS:
+        entry["partner_of"] = related_to
+        if relation == "other_spouse":
+            entry["relationship_type"] = RelationshipType[kind].value if kind else None
+    else:
+        entry[link_key] = related_to
+        entry["child_type"] = ChildType[kind].value if kind else None
+    return entry
+
+
+# recursive walk from a member along the parent/child edges, down to
+# children or up to parents, stopping after depth generations
+def lineage_cte(member_id, depth, upward=False):
+    edges = parent_child_edges()
+    if upward:
+        name, next_id, linked_id = "ancestors", edges.c.parent_id, edges.c.child_id
+    else:
+        name, next_id, linked_id = "descendants", edges.c.child_id, edges.c.parent_id
+    tree = (
+        db.select(
+            Member.id.label("member_id"),
+            db.cast(db.null(), db.String(50)).label("related_to"),
+            db.cast(db.null(), db.String(20)).label("kind"),
+            db.literal(0).label("depth"),
+        )
+        .where(Member.id == member_id)
+        .cte(name, recursive=True)
+    )
+    return tree.union_all(
+        db.select(
+            next_id,
+            linked_id,
+            db.cast(edges.c.child_type, db.String(20)),
+            tree.c.depth + 1,
+        )
+        .select_from(edges)
+        .join(tree, linked_id == tree.c.member_id)
+        .where(tree.c.depth < depth)
+    )
+
+
+def lineage_entries(rows, link_key):
+    entries, seen = [], set()
+    for member, related_to, kind, depth, relation in rows:
+        key = (
+            member.id,
+            relation,
+            related_to if relation in PARTNER_RELATIONS else None,
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        entries.append(tree_entry(member, depth, relation, related_to, kind, link_key))
+    return entries
+
+
+# descendants of a member with their spouses, in a single recursive query
+def get_descendants(member_id, depth):
+    depth = max(0, min(depth, MAX_TREE_DEPTH))
+    tree = lineage_cte(member_id, depth)
+    nodes = db.union_all(
+        db.select(
+            tree.c.member_id,
+            tree.c.related_to,
+            tree.c.kind,
+            tree.c.depth,
+            db.literal("descendant").label("relation"),
+        ),
+        db.select(
+            Spouse.wife_id,
+            tree.c.member_id,
+            db.null(),
+            tree.c.depth,
+            db.literal("spouse"),
+        )
+        .select_from(tree)
+        .join(Spouse, Spouse.husband_id == tree.c.member_id)
+        .where(Spouse.wife_id.isnot(None)),
+        db.select(
+            Spouse.husband_id,
+            tree.c.member_id,
+            db.null(),
+            tree.c.depth,
+            db.literal("spouse"),
+        )
+        .select_from(tree)
+        .join(Spouse, Spouse.wife_id == tree.c.member_id)
+        .where(Spouse.husband_id.isnot(None)),
+        db.select(
+            OtherSpouse.member_id,
+            tree.c.member_id,
+            db.cast(OtherSpouse.relationship_type, db.String(20)),
+            tree.c.depth,
+            db.literal("other_spouse"),
+        )
+        .select_from(tree)
+        .join(OtherSpouse, OtherSpouse.member_related_to == tree.c.member_id),
+    ).subquery("nodes")
+    rows = (
+        db.session.query(
+            Member, nodes.c.related_to, nodes.c.kind, nodes.c.depth, nodes.c.relation
+        )
+        .join(nodes, Member.id == nodes.c.member_id)
+        .order_by(nodes.c.depth)
+        .all()
+    )
+    if not rows:
+        return None
+    return lineage_entries(rows, "parent_id")
+
+
+# ancestors of a member, climbing both parents in a single recursive query
+def get_ancestors(member_id, depth):
+    depth = max(0, min(depth, MAX_TREE_DEPTH))
+    tree = lineage_cte(member_id, depth, upward=True)
+    rows = (
+        db.session.query(
+            Member,
+            tree.c.related_to,
+            tree.c.kind,
+            tree.c.depth,
+            db.literal("ancestor").label("relation"),
+        )
+        .join(tree, Member.id == tree.c.member_id)
+        .order_by(tree.c.depth)
+        .all()
+    )
+    if not rows:
+        return None
+    return lineage_entries(rows, "child_id")
+
+
+# nest a flat list of entries under the root; blood relatives hang off
+# branch_key through link_key, partners off "spouses"
+def nest_tree(member_id, entries, link_key="parent_id", branch_key="children"):
+    nodes = {}
+    for entry in entries:
+        if entry["relation"] not in PARTNER_RELATIONS:
+            nodes.setdefault(entry["id"], {**entry, "spouses": [], branch_key: []})
+    for entry in entries:
+        if entry["relation"] in PARTNER_RELATIONS:
+            if entry["partner_of"] in nodes:
+                nodes[entry["partner_of"]]["spouses"].append(entry)
+        elif entry["id"] != member_id and entry[link_key] in nodes:
+            nodes[entry[link_key]][branch_key].append(nodes[entry["id"]])
+    return nodes.get(member_id)
+
+
+STEP_CHILD_TYPES = (ChildType.step_son, ChildType.step_daughter)
+ADOPTED_CHILD_TYPES = (ChildType.adopted_son, ChildType.adopted_daughter)
+
+
+def not_step(child_type):
+    return child_type not in STEP_CHILD_TYPES
+
+
+# what other_id is to member_id, e.g. "first cousin once removed". blood and
+# adoptive lines are tried first, then step-child links, then partners and
+# step-parents through a parent's partner
+def get_relationship(member_id, other_id, depth=MAX_TREE_DEPTH):
+    depth = max(1, min(depth, MAX_TREE_DEPTH))
+    graph = get_kinship_graph()
+    members = load_members({member_id, other_id})
+    if member_id not in members or other_id not in members:
+        return None
+    if member_id not in graph or other_id not in graph:
+        graph = get_kinship_graph(refresh=True)
+    node, other = graph.nodes[member_id], graph.nodes[other_id]
+    male = members[other_id].gender == Gender.male
+    relationship = {
+        "relationship": None,
+        "common_ancestors": [],
+        "path": [],
+    }
+
+    found, step = None, False
+    for step in (False, True):
+        found = graph.common_ancestors(node, other, depth, None if step else not_step)
+        if found:
+            break
+    if found:
+        up, down, ancestors, via, other_via = found
+        links = graph.lineage(via, ancestors[0])
+        other_links = graph.lineage(other_via, ancestors[0])
+        half = bool(up and down) and set(graph.parents(links[-1][0])) != set(
+            graph.parents(other_links[-1][0])
+        )
+        label = kinship_label(up, down, male, half)
+        child_types = [child_type for _, child_type in links + other_links]
+        if step and any(child_type in STEP_CHILD_TYPES for child_type in child_types):
+            label = "step-" + label
+        elif up + down == 1 and child_types[0] in ADOPTED_CHILD_TYPES:
+            label = ("adoptive " if up else "adopted ") + label
+        path = (
+            [linked for linked, _ in links]
+            + [ancestors[0]]
+            + [linked for linked, _ in reversed(other_links)]
+        )
+        relationship.update(
+            relationship=label,
+            generations_up=up,
+            generations_down=down,
+            half=half,
+            adopted=any(
+                child_type in ADOPTED_CHILD_TYPES for child_type in child_types
+            ),
+            common_ancestors=ancestors,
+        )
+    elif other in graph.partners(node):
+        relationship_type = graph.partner_type(node, other)
+        label = relationship_type.value.lower() if relationship_type else None
+        relationship["relationship"] = label or ("husband" if male else "wife")
+        path = [node, other]
+    else:
+        path = []
+        for parent in graph.parents(node):
+            if other in graph.partners(parent):
+                relationship["relationship"] = "step-" + kinship_label(1, 0, male)
+                path = [node, parent, other]
+                break
+        for parent in graph.parents(other) if not path else []:
+            if node in graph.partners(parent):
+                relationship["relationship"] = "step-" + kinship_label(0, 1, male)
+                path = [node, parent, other]
+                break
+
+    path_ids = [graph.member_id(path_node) for path_node in path]
+    ancestor_ids = [
+        graph.member_id(ancestor) for ancestor in relationship["common_ancestors"]
+    ]
+    members.update(load_members(set(path_ids + ancestor_ids) - members.keys()))
+    relationship["path"] = [members[path_id].to_dict2() for path_id in path_ids]
+    relationship["common_ancestors"] = [
+        members[ancestor_id].to_dict2() for ancestor_id in ancestor_ids
+    ]
+    return relationship
+
+
+KINSHIP_PATH_HOPS = 12
+MAX_KINSHIP_PATH_HOPS = 50
+
+
+# shortest chain of parent/child/partner links between two members, in-laws
+# included; each member on the path says what it is to the previous one
+def get_kinship_path(member_id, other_id, max_hops=KINSHIP_PATH_HOPS):
+    max_hops = max(1, min(max_hops, MAX_KINSHIP_PATH_HOPS))
+    graph = get_kinship_graph()
+    members = load_members({member_id, other_id})
+    if member_id not in members or other_id not in members:
+        return None
+    if member_id not in graph or other_id not in graph:
+        graph = get_kinship_graph(refresh=True)
+    path = graph.shortest_path(graph.nodes[member_id], graph.nodes[other_id], max_hops)
+    if not path:
+        return {"hops": None, "max_hops": max_hops, "path": []}
+    path_ids = [graph.member_id(node) for node, _ in path]
+    members.update(load_members(set(path_ids) - members.keys()))
+    return {
+        "hops": len(path) - 1,
+        "max_hops": max_hops,
+        "path": [
+            {**members[path_id].to_dict2(), "link": link}
+            for path_id, (_, link) in zip(path_ids, path)
+        ],
+    }
+
+
+ModeratorIdentity = namedtuple(
+    "ModeratorIdentity", ["id", "is_super_admin", "status", "role"]
+)
+IDENTITY_CACHE_TTL = 60
+
+
+def identity_cache_key(mod_id):
+    return f"identity:{mod_id}"
+
+
+# slim moderator record behind current_user, cached for a short TTL so an
+# authenticated request doesn't need a moderators lookup
+def get_moderator_identity(mod_id):
+    key = identity_cache_key(mod_id)
+    record = cache.get(key)
+    if record is None:
+        mod = db.session.get(Moderators, mod_id)
+        if not mod:
+            return None
+        record = [mod.id, mod.is_super_admin, mod.status, mod.role]
+        cache.set(key, record, IDENTITY_CACHE_TTL)
+    return ModeratorIdentity(*record)
+
+
+def evict_moderator_identity(mod_id):
+    cache.delete(identity_cache_key(mod_id))
 
 
 def verify_mod_login(email, password):
@@ -859,7 +1713,7 @@ def email_exists(email):
     return Moderators.query.filter_by(email=email.lower()).first()
 
 
-def get_all_members(page, per_page, fullname):
+def filter_members(fullname):
     members = Member.query
     if fullname:
         members = members.filter(
@@ -868,13 +1722,173 @@ def get_all_members(page, per_page, fullname):
                 Member.last_name.ilike(f"%{fullname}%"),
             )
         )
-    members = members.order_by(Member.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    return members
+
+
+def get_all_members(page, per_page, fullname):
+    members = (
+        filter_members(fullname)
+        .order_by(Member.created_at.desc(), Member.id.desc())
+        .paginate(page=page, per_page=per_page, error_out=False)
     )
 
     return members
 
 
+# every query word has to prefix-match a token of the member; a member's
+# score adds up the best field weight per word, plus a bonus for whole words
+def search_members(q, page, per_page):
+    words = query_words(q)
+    if not words:
+        return [], False
+    matches = db.union_all(
+        *(
+            db.select(
+                MemberSearch.member_id,
+                db.literal(position).label("word"),
+                (
+                    MemberSearch.weight
+                    + db.case((MemberSearch.token == word, EXACT_MATCH_BONUS), else_=0)
+                ).label("score"),
+            ).where(MemberSearch.token >= word, MemberSearch.token < prefix_end(word))
+            for position, word in enumerate(words)
+        )
+    ).subquery("matches")
+    per_word = (
+        db.select(matches.c.member_id, db.func.max(matches.c.score).label("score"))
+        .group_by(matches.c.member_id, matches.c.word)
+        .subquery("per_word")
+    )
+    score = db.func.sum(per_word.c.score).label("score")
+    ranked = db.session.execute(
+        db.select(per_word.c.member_id, score)
+        .group_by(per_word.c.member_id)
+        .having(db.func.count() == len(words))
+        .order_by(score.desc(), per_word.c.member_id)
+        .limit(per_page + 1)
+        .offset((page - 1) * per_page)
+    ).all()
+    has_next = len(ranked) > per_page
+    member_ids = [row.member_id for row in ranked[:per_page]]
+    members = {
+        member.id: member
+        for member in Member.query.filter(Member.id.in_(member_ids)).all()
+    }
+    return [members[member_id] for member_id in member_ids], has_next
+
+
+FUZZY_CANDIDATES = 500
+
+
+# keys are [A-Z] and compared by code point (the key columns are binary on
+# MySQL), so "~" sorts after every key sharing the stem
+def phonetic_match(column, key):
+    stem = phonetic_stem(key)
+    if stem is None:
+        return column == key
+    return db.and_(column >= stem, column < stem + "~")
+
+
+# candidates come from the indexed name keys, every query word has to sound
+# like the first or last name. Edit distance can't be computed in SQL, so
+# candidates are read in windows of FUZZY_CANDIDATES, members matching more
+# keys exactly first, and ranked by edit distance within their window; a
+# better spelling past the first window ranks below the whole first window
+def fuzzy_search_members(q, page, per_page):
+    keys = {word: phonetic_key(word) for word in query_words(q)}
+    keys = {word: key for word, key in keys.items() if key}
+    if not keys:
+        return [], False
+    inexact = sum(
+        db.case(
+            (
+                db.or_(Member.first_name_key == key, Member.last_name_key == key),
+                0,
+            ),
+            else_=1,
+        )
+        for key in keys.values()
+    )
+    start = (page - 1) * per_page
+    end = start + per_page
+    first = start // FUZZY_CANDIDATES * FUZZY_CANDIDATES
+    last = -(-end // FUZZY_CANDIDATES) * FUZZY_CANDIDATES
+    candidates = (
+        Member.query.filter(
+            *(
+                db.or_(
+                    phonetic_match(Member.first_name_key, key),
+                    phonetic_match(Member.last_name_key, key),
+                )
+                for key in keys.values()
+            )
+        )
+        .order_by(inexact, Member.id)
+        .offset(first)
+        .limit(last - first + 1)
+        .all()
+    )
+
+    def distance(member):
+        names = [
+            "".join(tokenize(member.first_name)),
+            "".join(tokenize(member.last_name)),
+        ]
+        return sum(min(edit_distance(word, name) for name in names) for word in keys)
+
+    ranked = []
+    for offset in range(0, last - first, FUZZY_CANDIDATES):
+        window = candidates[offset : offset + FUZZY_CANDIDATES]
+        ranked += sorted(window, key=lambda member: (distance(member), member.id))
+    return ranked[start - first : end - first], len(candidates) > end - first
+
+
+COUNT_CACHE_TTL = 60
+
+
+# the filters are user input, so the key holds their digest
+def count_cache_key(*filters):
+    digest = hashlib.sha1(json.dumps(filters).encode("utf-8")).hexdigest()
+    return f"count:{digest}"
+
+
+# total rows for a listing, cached so cursor pages don't pay for COUNT(*)
+def cached_count(key, query):
+    total = cache.get(key)
+    if total is None:
+        total = query.order_by(None).count()
+        cache.set(key, total, COUNT_CACHE_TTL)
+    return total
+
+
+# keyset page over (created_at, id), newest first
+def get_members_by_cursor(cursor, per_page, fullname):
+    members = filter_members(fullname)
+    if cursor:
+        created_at, member_id = cursor
+        created_at = datetime.fromisoformat(created_at)
+        members = members.filter(
+            db.or_(
+                Member.created_at < created_at,
+                db.and_(Member.created_at == created_at, Member.id < member_id),
+            )
+        )
+    items = (
+        members.order_by(Member.created_at.desc(), Member.id.desc())
+        .limit(per_page + 1)
+        .all()
+    )
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+    return items, next_cursor
+
+
+def count_members(fullname):
+    return cached_count(count_cache_key("members", fullname), filter_members(fullname))
+
+
 # Update mod
 def update_mod(mod_id, delete=False, **kwargs):
     mod = Moderators.query.filter_by(id=mod_id).first()
@@ -884,6 +1898,7 @@ def update_mod(mod_id, delete=False, **kwargs):
     if delete:
         db.session.delete(mod)
         db.session.commit()
+        evict_moderator_identity(mod_id)
         return True
 
     # Update mod attributes with provided keyword arguments
@@ -895,6 +1910,7 @@ def update_mod(mod_id, delete=False, **kwargs):
     # hash password
 
     db.session.commit()
+    evict_moderator_identity(mod_id)
     return True
 
 
@@ -906,27 +1922,67 @@ def change_password(mod_id, old_password, new_password):
 
     mod.password = hasher.hash(new_password)
     db.session.commit()
+    evict_moderator_identity(mod_id)
     return True
 
 
 # get all mods
-def get_all_mods(page, per_page, fullname, email):
+def filter_mods(fullname, email):
     mods = Moderators.query
     if fullname:
         mods = mods.filter(Moderators.fullname.ilike(f"%{fullname}%"))
 
     if email:
         mods = mods.filter(Moderators.email.ilike(f"%{email}%"))
+    return mods
+
 
-    mods = mods.order_by(Moderators.fullname.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+def get_all_mods(page, per_page, fullname, email):
+    mods = (
+        filter_mods(fullname, email)
+        .order_by(Moderators.fullname.desc(), Moderators.id.desc())
+        .paginate(page=page, per_page=per_page, error_out=False)
     )
 
     return mods
 
 
+# keyset page over (fullname, id), same order as get_all_mods
+def get_mods_by_cursor(cursor, per_page, fullname, email):
+    mods = filter_mods(fullname, email)
+    if cursor:
+        last_fullname, mod_id = cursor
+        mods = mods.filter(
+            db.or_(
+                Moderators.fullname < last_fullname,
+                db.and_(Moderators.fullname == last_fullname, Moderators.id < mod_id),
+            )
+        )
+    items = (
+        mods.order_by(Moderators.fullname.desc(), Moderators.id.desc())
+        .limit(per_page + 1)
+        .all()
+    )
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1].fullname, items[-1].id)
+    return items, next_cursor
+
+
+def count_mods(fullname, email):
+    return cached_count(
+        count_cache_key("mods", fullname, email), filter_mods(fullname, email)
+    )
+
+
 def get_members_other_spouses(member_id):
-    others = OtherSpouse.query.filter_by(member_related_to=member_id).all()
+    # the member_related_to index would otherwise decide the order
+    others = (
+        OtherSpouse.query.filter_by(member_related_to=member_id)
+        .order_by(OtherSpouse.id)
+        .all()
+    )
     return [other.to_dict2() for other in others]
 
 
@@ -956,6 +2012,23 @@ def get_items_from_gallery():
         return None
 
 
+def gallery_etag(ids):
+    digest = hashlib.sha1(",".join(sorted(ids)).encode("utf-8")).hexdigest()
+    return f"gallery-{digest}"
+
+
+# gallery items are only ever added or deleted, so their ids identify the
+# content; the ETag is read from the primary key on each request, which
+# every worker agrees on, without loading the images
+def get_gallery_etag():
+    return gallery_etag(db.session.scalars(db.select(Gallery.id)).all())
+
+
+def get_gallery_view():
+    items = [item.to_dict() for item in Gallery.query.all()]
+    return items, gallery_etag(item["id"] for item in items)
+
+
 # Delete gallery item
 
 
@@ -1023,6 +2096,7 @@ def add_or_update_logo(
             existing_logo.clan_name = (
                 clan_name if clan_name else existing_logo.clan_name
             )
+            existing_logo.version = Logo.version + 1
         else:
             existing_logo = Logo(
                 logo_image=logo_image,
@@ -1038,6 +2112,7 @@ def add_or_update_logo(
             db.session.add(existing_logo)
 
         db.session.commit()
+        logo_settings.clear()
         return True
     except Exception as e:
         db.session.rollback()
@@ -1050,6 +2125,34 @@ def get_logo_details():
     return logo.to_dict()
 
 
+LOGO_CHECK_INTERVAL = 5
+LOGO_MAX_AGE = 60
+logo_settings = {}
+
+
+# the Logo row is a site-wide singleton: each process keeps its serialized
+# copy and only re-reads the row's version, at most every
+# LOGO_CHECK_INTERVAL seconds, to pick up edits made through other workers
+def get_logo_settings():
+    now = datetime.now()
+    current = logo_settings.get("current")
+    if current and current["recheck_at"] > now:
+        return current["data"], current["etag"]
+    row = db.session.execute(db.select(Logo.id, Logo.version).limit(1)).first()
+    if not current or current["row"] != tuple(row or ()):
+        logo = Logo.query.filter_by(id=row.id).first() if row else None
+        current = {
+            "row": tuple(row or ()),
+            "data": logo.to_dict() if logo else None,
+            "etag": f"logo-{row.id}-{row.version}" if row else None,
+        }
+    logo_settings["current"] = {
+        **current,
+        "recheck_at": now + timedelta(seconds=LOGO_CHECK_INTERVAL),
+    }
+    return current["data"], current["etag"]
+
+
 # def recursive_delete(member, visited=None):
 #     if visited is None:
 #         visited = set()
@@ -1124,58 +2227,133 @@ def get_logo_details():
 #     return True
 
 
-def recursive_delete(member, visited=None):
-    if visited is None:
-        visited = set()
+DELETE_CHUNK_SIZE = 500
 
-    # If the member has already been visited, return to avoid infinite recursion
-    if member.id in visited:
-        return
 
-    # Mark the member as visited
-    visited.add(member.id)
-
-    # Function to handle spouse and child deletion logic
-    def delete_spouse_and_children(spouse_id, spouse_type):
-        spouse_member = Member.query.get(spouse_id)
-        if spouse_member:
-            children = get_children2(
-                spouse_type.id
-            )  # Get the children linked to the spouse
-            for child in children:
-                child_member = child.member
-                if child_member:
-                    db.session.delete(child)  # Delete the child record
-                    db.session.delete(child_member)  # Delete the child member
-                    recursive_delete(child_member, visited)
-            db.session.delete(spouse_member)  # Delete the spouse member
-
-    # Process husband-spouse relationships
-    if member.husband_spouse:
-        for spouse in member.husband_spouse:
-            delete_spouse_and_children(spouse.wife_id, spouse)
-            db.session.delete(spouse)  # Delete the spouse record
-
-    # Process wife-spouse relationships
-    if member.wife_spouse:
-        for spouse in member.wife_spouse:
-            delete_spouse_and_children(spouse.husband_id, spouse)
-            db.session.delete(spouse)  # Delete the spouse record
-
-    # Process other spouses (other_spouses2)
-    if member.other_spouses2:
-        for other_spouse in member.other_spouses2:
-            spouse_member = Member.query.get(other_spouse.member_id)
-            if spouse_member:
-                db.session.delete(spouse_member)
-                recursive_delete(spouse_member, visited)
-            db.session.delete(other_spouse)  # Delete the other spouse record
-
-    # Delete the main member and commit changes in one transaction
-    db.session.delete(member)
-    db.session.commit()
+def chunked(ids, size=DELETE_CHUNK_SIZE):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i : i + size]
 
-    return True
+
+# ids in column for rows matching any (filter_column, ids) pair, queried in
+# chunks so large id sets stay within the driver's parameter limits
+def select_ids(column, *filters):
+    found = set()
+    for filter_column, ids in filters:
+        for chunk in chunked(ids):
+            rows = db.session.scalars(db.select(column).where(filter_column.in_(chunk)))
+            found.update(row for row in rows if row is not None)
+    return found
+
+
+# collect everything removed together with a member: descendants through
+# spouse and other-spouse children, their partners and other spouses, and
+# every spouse/child/other_spouse row pointing at a removed member
+def collect_member_tree(member_id):
+    member_ids = {member_id}
+    frontier = {member_id}
+    while frontier:
+        spouse_ids = select_ids(
+            Spouse.id, (Spouse.husband_id, frontier), (Spouse.wife_id, frontier)
+        )
+        partner_ids = select_ids(Spouse.husband_id, (Spouse.id, spouse_ids))
+        partner_ids |= select_ids(Spouse.wife_id, (Spouse.id, spouse_ids))
+        children = select_ids(
+            Child.member_id, (Child.spouse_id, spouse_ids), (Child.mother_id, frontier)
+        )
+        other_spouses = select_ids(
+            OtherSpouse.member_id, (OtherSpouse.member_related_to, frontier)
+        )
+        member_ids |= partner_ids
+        frontier = (children | other_spouses) - member_ids
+        member_ids |= frontier
+
+    return {
+        "members": member_ids,
+        "spouses": select_ids(
+            Spouse.id, (Spouse.husband_id, member_ids), (Spouse.wife_id, member_ids)
+        ),
+        "children": select_ids(
+            Child.id, (Child.member_id, member_ids), (Child.mother_id, member_ids)
+        ),
+        "other_spouses": select_ids(
+            OtherSpouse.id,
+            (OtherSpouse.member_id, member_ids),
+            (OtherSpouse.member_related_to, member_ids),
+        ),
+    }
+
+
+def bulk_delete(model, ids):
+    for chunk in chunked(ids):
+        db.session.execute(
+            db.delete(model).where(model.id.in_(chunk)),
+            execution_options={"synchronize_session": False},
+        )
+
+
+def bulk_delete_search(member_ids):
+    for chunk in chunked(member_ids):
+        db.session.execute(
+            db.delete(MemberSearch).where(MemberSearch.member_id.in_(chunk)),
+            execution_options={"synchronize_session": False},
+        )
+
+
+def bulk_unlink(column, ids):
+    for chunk in chunked(ids):
+        db.session.execute(
+            db.update(column.class_)
+            .where(column.in_(chunk))
+            .values({column.key: None}),
+            execution_options={"synchronize_session": False},
+        )
+
+
+# delete a member and its subtree with a handful of bulk statements in one
+# transaction; dry_run only reports what would be removed
+def delete_member_tree(member_id, dry_run=False):
+    if not db.session.get(Member, member_id):
+        return None
+    tree = collect_member_tree(member_id)
+    report = {
+        "members": len(tree["members"]),
+        "spouses": len(tree["spouses"]),
+        "children": len(tree["children"]),
+        "other_spouses": len(tree["other_spouses"]),
+        "member_ids": sorted(tree["members"]),
+    }
+    if dry_run:
+        return report
+
+    try:
+        bulk_delete(OtherSpouse, tree["other_spouses"])
+        bulk_delete(Child, tree["children"])
+        # rows outside the subtree that still point at a removed spouse row
+        bulk_unlink(OtherSpouse.spouse_id, tree["spouses"])
+        bulk_unlink(Child.spouse_id, tree["spouses"])
+        bulk_delete(Spouse, tree["spouses"])
+        bulk_delete_search(tree["members"])
+        bulk_delete(Member, tree["members"])
+        queue_graph_patch(
+            "remove",
+            tree["members"],
+            tree["spouses"],
+            tree["children"],
+            tree["other_spouses"],
+        )
+        queue_suggest_patch("remove", *tree["members"])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.expire_all()
+    return report
+
+
+def recursive_delete(member):
+    return delete_member_tree(member.id)
 
 
 """
@@ -0,0 +1,121 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import time
+from datetime import datetime
+from flask import g, request
+from flask_jwt_extended import get_current_user, verify_jwt_in_request
+
+DEFAULT_MAX_FILES = 200
+PROFILE_HEADER = "X-Profile"
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.prof$")
+PROFILE_SORTS = tuple(pstats.Stats.sort_arg_dict_default)
+
+
+class Profiler:
+    """cProfile around single requests, written as pstats files to
+    PROFILE_DIR.
+
+    A request is profiled when a super admin sends "X-Profile: 1" or
+    ?profile=1, or at random with PROFILE_SAMPLE_RATE (0 to 1). The file
+    name comes back in the X-Profile-Id header. Only the newest
+    PROFILE_MAX_FILES files are kept. Off unless PROFILE_DIR is set.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+
+    def init_app(self, app):
+        app.extensions["profiler"] = self
+        self.directory = app.config.get("PROFILE_DIR")
+        self.enabled = bool(self.directory)
+        if not self.enabled:
+            return
+        self.sample_rate = app.config.get("PROFILE_SAMPLE_RATE", 0.0)
+        self.max_files = app.config.get("PROFILE_MAX_FILES", DEFAULT_MAX_FILES)
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.teardown_request)
+
+    def wanted(self):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        flagged = (
+            request.headers.get(PROFILE_HEADER) == "1"
+            or request.args.get("profile") == "1"
+        )
+        if not flagged:
+            return False
+        # the flag is honoured for super admins only
+        try:
+            verify_jwt_in_request(optional=True)
+        except Exception:
+            return False
+        user = get_current_user()
+        return user is not None and user.is_super_admin
+
+    def start_request(self):
+        if not self.wanted():
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is already running in this thread
+            return
+        g.profile = (profile, time.perf_counter())
+
+    def finish_request(self, response):
+        started = g.pop("profile", None)
+        if started is None:
+            return response
+        profile, started_at = started
+        profile.disable()
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        name = "{}-{}-{}-{:.0f}ms.prof".format(
+            datetime.now().strftime("%Y%m%dT%H%M%S%f"),
+            request.endpoint or "unmatched",
+            os.getpid(),
+            elapsed_ms,
+        )
+        profile.dump_stats(os.path.join(self.directory, name))
+        self.prune()
+        response.headers["X-Profile-Id"] = name
+        return response
+
+    def teardown_request(self, error=None):
+        started = g.pop("profile", None)
+        if started is not None:
+            started[0].disable()
+
+    def prune(self):
+        names = self.list_profiles()
+        for name in names[self.max_files :]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    # newest first
+    def list_profiles(self):
+        names = [n for n in os.listdir(self.directory) if PROFILE_NAME_RE.match(n)]
+        return sorted(names, reverse=True)
+
+    def profile_path(self, name):
+        if not PROFILE_NAME_RE.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+# the top of a pstats file as text, sorted like pstats sorts
+def profile_summary(path, sort="cumulative", limit=40):
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
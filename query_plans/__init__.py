@@ -0,0 +1,107 @@
+import re
+from extensions import db
+from models import Member, Moderators, Spouse, OtherSpouse, Child
+
+
+# hot lookups and the index each of them is expected to use
+def hot_lookups():
+    member_id = "0" * 32
+    return [
+        (
+            "has_spouse (husband)",
+            db.select(Spouse).where(Spouse.husband_id == member_id),
+            "ix_spouse_husband_id",
+        ),
+        (
+            "has_spouse (wife)",
+            db.select(Spouse).where(Spouse.wife_id == member_id),
+            "ix_spouse_wife_id",
+        ),
+        (
+            "get_children",
+            db.select(Child).where(Child.spouse_id == member_id),
+            "ix_child_spouse_id",
+        ),
+        (
+            "member.child",
+            db.select(Child).where(Child.member_id == member_id),
+            "ix_child_member_id",
+        ),
+        (
+            "get_other_spouse_children",
+            db.select(Child).where(Child.mother_id == member_id),
+            "ix_child_mother_id",
+        ),
+        (
+            "get_other_spouses",
+            db.select(OtherSpouse).where(OtherSpouse.member_related_to == member_id),
+            "ix_other_spouse_member_related_to_member_id",
+        ),
+        (
+            "get_related_spouse",
+            db.select(OtherSpouse).where(
+                OtherSpouse.member_related_to == member_id,
+                OtherSpouse.member_id == member_id,
+            ),
+            "ix_other_spouse_member_related_to_member_id",
+        ),
+        (
+            "member.other_spouses",
+            db.select(OtherSpouse).where(OtherSpouse.member_id == member_id),
+            "ix_other_spouse_member_id",
+        ),
+        (
+            "get_all_members",
+            db.select(Member)
+            .order_by(Member.created_at.desc(), Member.id.desc())
+            .limit(10),
+            "ix_member_created_at_id",
+        ),
+        (
+            "get_all_mods",
+            db.select(Moderators)
+            .order_by(Moderators.fullname.desc(), Moderators.id.desc())
+            .limit(10),
+            "ix_moderators_fullname_id",
+        ),
+        (
+            "verify_mod_login",
+            db.select(Moderators).where(Moderators.email == "mod@example.com"),
+            "ix_moderators_email",
+        ),
+    ]
+
+
+# the plan rows of statement, as dicts of their columns
+def explain(statement):
+    dialect = db.engine.dialect
+    sql = str(
+        statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+    )
+    prefix = "EXPLAIN QUERY PLAN" if dialect.name == "sqlite" else "EXPLAIN"
+    return [
+        dict(row._mapping) for row in db.session.execute(db.text(f"{prefix} {sql}"))
+    ]
+
+
+# whether the plan reads through index: MySQL names the chosen index in the
+# key column (possible_keys only lists candidates), SQLite in the detail of
+# a SEARCH or SCAN step
+def uses_index(plan, index):
+    if db.engine.dialect.name == "sqlite":
+        used = re.compile(rf"USING (COVERING )?INDEX {re.escape(index)}\b")
+        return any(used.search(row["detail"]) for row in plan)
+    return any(index in (row["key"] or "").split(",") for row in plan)
+
+
+def plan_text(plan):
+    return " | ".join(" ".join(str(value) for value in row.values()) for row in plan)
+
+
+# (name, index, used, plan text) for every hot lookup
+def check_lookups():
+    results = []
+    for name, statement, index in hot_lookups():
+        plan = explain(statement)
+        results.append((name, index, uses_index(plan, index), plan_text(plan)))
+    return results
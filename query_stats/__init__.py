@@ -0,0 +1,138 @@
+import threading
+import time
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+STATEMENT_PREVIEW = 300
+current_queries = ContextVar("current_queries", default=None)
+
+
+class RequestQueries:
+    """Queries run while serving one request."""
+
+    __slots__ = ("started", "query_started", "count", "db_time", "slowest")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_started = None
+        self.count = 0
+        self.db_time = 0.0
+        self.slowest = (0.0, None)
+
+
+class EndpointStats:
+    __slots__ = ("requests", "queries", "db_time", "time", "max_queries", "slowest")
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.time = 0.0
+        self.max_queries = 0
+        self.slowest = (0.0, None)
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "queries": self.queries,
+            "avg_queries": round(self.queries / self.requests, 2),
+            "max_queries": self.max_queries,
+            "db_ms": round(self.db_time * 1000, 2),
+            "avg_db_ms": round(self.db_time * 1000 / self.requests, 2),
+            "avg_ms": round(self.time * 1000 / self.requests, 2),
+            "slowest_ms": round(self.slowest[0] * 1000, 2),
+            "slowest_statement": self.slowest[1],
+        }
+
+
+# cursor events only do work while a request is being measured, so the
+# listeners are registered once for every engine
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query(conn, cursor, statement, parameters, context, executemany):
+    queries = current_queries.get()
+    if queries is not None:
+        queries.query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def end_query(conn, cursor, statement, parameters, context, executemany):
+    queries = current_queries.get()
+    if queries is None or queries.query_started is None:
+        return
+    elapsed = time.perf_counter() - queries.query_started
+    queries.query_started = None
+    queries.count += 1
+    queries.db_time += elapsed
+    if elapsed > queries.slowest[0]:
+        queries.slowest = (elapsed, statement)
+
+
+class QueryStats:
+    """Per-request SQL count and timing, reported as Server-Timing headers
+    and aggregated per endpoint.
+
+    Off unless QUERY_STATS_ENABLED is set.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        app.extensions["query_stats"] = self
+        self.enabled = app.config.get("QUERY_STATS_ENABLED", False)
+        if not self.enabled:
+            return
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.teardown_request)
+
+    def start_request(self):
+        g.query_stats_token = current_queries.set(RequestQueries())
+
+    def finish_request(self, response):
+        queries = current_queries.get()
+        if queries is None:
+            return response
+        elapsed = time.perf_counter() - queries.started
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={queries.db_time * 1000:.2f};desc="{queries.count} queries", '
+            f"db-slowest;dur={queries.slowest[0] * 1000:.2f}, "
+            f"app;dur={elapsed * 1000:.2f}",
+        )
+        self.record(request.endpoint or "unmatched", queries, elapsed)
+        return response
+
+    def teardown_request(self, error=None):
+        token = g.pop("query_stats_token", None)
+        if token is not None:
+            current_queries.reset(token)
+
+    def record(self, endpoint, queries, elapsed):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.requests += 1
+            stats.queries += queries.count
+            stats.db_time += queries.db_time
+            stats.time += elapsed
+            stats.max_queries = max(stats.max_queries, queries.count)
+            if queries.slowest[0] > stats.slowest[0]:
+                duration, statement = queries.slowest
+                stats.slowest = (duration, statement[:STATEMENT_PREVIEW])
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                endpoint: stats.to_dict()
+                for endpoint, stats in sorted(self.endpoints.items())
+            }
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
@@ -0,0 +1,236 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+MAX_TOKEN_LENGTH = 50
+MAX_QUERY_WORDS = 5
+# shorter words match whole tokens only, a lone letter would match half the index
+MIN_PREFIX_LENGTH = 2
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+# member columns that are searchable and how much a match on each is worth
+SEARCH_FIELDS = (
+    ("first_name", 3),
+    ("last_name", 3),
+    ("birth_name", 2),
+    ("birth_place", 1),
+    ("occupation", 1),
+)
+EXACT_MATCH_BONUS = 2
+
+
+# lowercase and strip accents so "Adébáyọ̀" matches "adebayo"
+def fold(text):
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    tokens = []
+    for word in WORD_RE.findall(fold(text)):
+        word = word[:MAX_TOKEN_LENGTH]
+        if word not in tokens:
+            tokens.append(word)
+    return tokens
+
+
+# the index rows for one member, values is a Member or a dict of its columns
+def search_rows(member_id, values):
+    if not isinstance(values, dict):
+        values = {field: getattr(values, field) for field, _ in SEARCH_FIELDS}
+    return [
+        {"token": token, "member_id": member_id, "field": field, "weight": weight}
+        for field, weight in SEARCH_FIELDS
+        for token in tokenize(values.get(field))
+    ]
+
+
+# upper bound of the range holding every token that starts with prefix;
+# tokens are [a-z0-9] and compared by code point (member_search.token is
+# binary on MySQL), so bumping the last character is enough
+def prefix_end(prefix):
+    if len(prefix) < MIN_PREFIX_LENGTH:
+        return prefix + "0"
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def query_words(q):
+    return tokenize(q)[:MAX_QUERY_WORDS]
+
+
+PHONETIC_KEY_LENGTH = 16
+# sounds written with two letters, checked before the single letters
+PHONETIC_DIGRAPHS = {
+    "ph": "F",
+    "sh": "X",
+    "ch": "X",
+    "th": "T",
+    "ck": "K",
+    "gh": "K",
+    "qu": "K",
+    "dg": "J",
+}
+PHONETIC_LETTERS = {
+    "b": "B",
+    "c": "K",
+    "d": "T",
+    "f": "F",
+    "g": "K",
+    "j": "J",
+    "k": "K",
+    "l": "L",
+    "m": "M",
+    "n": "N",
+    "p": "P",
+    "q": "K",
+    "r": "R",
+    "s": "S",
+    "t": "T",
+    "v": "F",
+    "x": "KS",
+    "z": "S",
+}
+SOFTENED = {"c": "S", "g": "J"}
+
+
+# metaphone-style key: consonant sounds only, vowels and h/w/y count just as
+# the first letter, repeated sounds collapse. "Oluwaseun" -> "ALSN"
+def phonetic_key(text):
+    word = "".join(re.findall(r"[a-z]", fold(text)))
+    sounds = []
+    i = 0
+    while i < len(word):
+        pair, letter, following = word[i : i + 2], word[i], word[i + 1 : i + 2]
+        if pair in PHONETIC_DIGRAPHS:
+            sound = PHONETIC_DIGRAPHS[pair]
+            i += 2
+        else:
+            i += 1
+            if letter in SOFTENED and following and following in "eiy":
+                sound = SOFTENED[letter]
+            elif letter in PHONETIC_LETTERS:
+                sound = PHONETIC_LETTERS[letter]
+            elif i == 1:
+                sound = "A" if letter in "aeiou" else letter.upper()
+            else:
+                sound = ""
+        if sound and (not sounds or sounds[-1] != sound):
+            sounds.append(sound)
+    return "".join(sounds)[:PHONETIC_KEY_LENGTH]
+
+
+# spelling variants share the key minus its last sound, so "Adebayo" (ATB)
+# and "Adebayor" (ATBR) find each other; keys this short must match exactly
+PHONETIC_STEM_LENGTH = 3
+
+
+def phonetic_stem(key):
+    if len(key) < PHONETIC_STEM_LENGTH:
+        return None
+    return key[:-1] if len(key) > PHONETIC_STEM_LENGTH else key
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y))
+            )
+        previous = current
+    return previous[-1]
+
+
+SUGGEST_SCAN_LIMIT = 1000
+
+
+class PrefixIndex:
+    """Sorted (term, member_id) array for name autocomplete.
+
+    Terms are the folded words of a member's names; a prefix lookup is a
+    bisect into the array followed by a forward scan. Every member keeps its
+    terms and a ready-made payload, so answering a lookup never touches the
+    database. Patches are idempotent like the kinship graph's.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        self.loaded = False
+        self.expires_at = None
+        self.version = None
+        self.entries = []
+        self.members = {}
+
+    def add(self, member_id, terms, payload):
+        with self.lock:
+            self.remove(member_id)
+            terms = tuple(terms)
+            self.members[member_id] = (terms, term_text(terms), payload)
+            for term in terms:
+                insort(self.entries, (term, member_id))
+
+    def remove(self, *member_ids):
+        with self.lock:
+            for member_id in member_ids:
+                terms = self.members.pop(member_id, ((),))[0]
+                for term in terms:
+                    i = bisect_left(self.entries, (term, member_id))
+                    if i < len(self.entries) and self.entries[i] == (term, member_id):
+                        del self.entries[i]
+
+    def reset(self):
+        with self.lock:
+            self.clear()
+
+    def build(self, rows, expires_at=None):
+        with self.lock:
+            self.clear()
+            for member_id, terms, payload in rows:
+                self.members[member_id] = (terms, term_text(terms), payload)
+                self.entries.extend((term, member_id) for term in terms)
+            self.entries.sort()
+            self.loaded = True
+            self.expires_at = expires_at
+
+    # the word with the fewest matching terms drives the scan, the other
+    # words have to prefix some term of the same member
+    def suggest(self, words, limit):
+        if not words:
+            return []
+        results, seen = [], set()
+        with self.lock:
+            entries, members = self.entries, self.members
+            start, end, head = min(
+                (
+                    (
+                        bisect_left(entries, (word,)),
+                        bisect_left(entries, (word + "{",)),
+                        word,
+                    )
+                    for word in words
+                ),
+                key=lambda scan: scan[1] - scan[0],
+            )
+            rest = [" " + word for word in words]
+            rest.remove(" " + head)
+            end = min(end, start + SUGGEST_SCAN_LIMIT)
+            for term, member_id in entries[start:end]:
+                if member_id in seen:
+                    continue
+                seen.add(member_id)
+                _, text, payload = members[member_id]
+                if all(word in text for word in rest):
+                    results.append(payload)
+                    if len(results) == limit:
+                        break
+        return results
+
+
+# " term term", so " " + word in it tells whether word prefixes a term
+def term_text(terms):
+    return "".join(" " + term for term in terms)
@@ -0,0 +1,178 @@
+import glob
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from flask import has_request_context, request
+from sqlalchemy import event
+
+DEFAULT_THRESHOLD_MS = 100
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUPS = 3
+# a fingerprint is explained at most once per interval
+EXPLAIN_INTERVAL = 300
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST_RE = re.compile(
+    r"\(\s*(?:\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|%\(\w+\)s))+\s*\)"
+)
+SPACE_RE = re.compile(r"\s+")
+
+
+# the statement with literals and placeholder lists flattened, so the same
+# query with other values or IN list lengths lands in one group
+def fingerprint(statement):
+    normalized = LITERAL_RE.sub("?", statement)
+    normalized = PLACEHOLDER_LIST_RE.sub("(?+)", normalized)
+    normalized = SPACE_RE.sub(" ", normalized).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12], normalized
+
+
+# types of the bound values, never the values themselves
+def parameter_shape(parameters, executemany):
+    if executemany:
+        rows = list(parameters or [])
+        first = parameter_shape(rows[0], False) if rows else None
+        return {"rows": len(rows), "first": first}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+class SlowQueryLog:
+    """Writes statements slower than SLOW_QUERY_THRESHOLD_MS, with their
+    parameter shape, endpoint and EXPLAIN plan, as JSON lines to the
+    rotating file SLOW_QUERY_LOG.
+
+    Off unless SLOW_QUERY_LOG is set.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.logger = None
+        self.explained = {}
+        self.lock = threading.Lock()
+
+    # needs the sqlalchemy extension to be set up first
+    def init_app(self, app):
+        app.extensions["slow_queries"] = self
+        self.path = app.config.get("SLOW_QUERY_LOG")
+        self.enabled = bool(self.path)
+        if not self.enabled:
+            return
+        self.threshold = app.config.get("SLOW_QUERY_THRESHOLD_MS", DEFAULT_THRESHOLD_MS)
+        handler = RotatingFileHandler(
+            self.path,
+            maxBytes=app.config.get("SLOW_QUERY_LOG_MAX_BYTES", DEFAULT_MAX_BYTES),
+            backupCount=app.config.get("SLOW_QUERY_LOG_BACKUPS", DEFAULT_BACKUPS),
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger = logging.getLogger("familytree.slow_queries")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.handlers = [handler]
+        with app.app_context():
+            engine = app.extensions["sqlalchemy"].engine
+        event.listen(engine, "before_cursor_execute", self.start_query)
+        event.listen(engine, "after_cursor_execute", self.end_query)
+        event.listen(engine, "handle_error", self.drop_query)
+
+    def start_query(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+    def end_query(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["slow_query_started"].pop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms < self.threshold:
+            return
+        key, normalized = fingerprint(statement)
+        entry = {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "duration_ms": round(elapsed_ms, 2),
+            "fingerprint": key,
+            "statement": normalized,
+            "parameters": parameter_shape(parameters, executemany),
+            "endpoint": request.endpoint if has_request_context() else None,
+            "explain": None,
+        }
+        if not executemany and self.should_explain(key):
+            entry["explain"] = self.explain(
+                conn, cursor, statement, parameters, context
+            )
+        self.logger.info(json.dumps(entry, default=str))
+
+    # a failed statement never reaches after_cursor_execute
+    def drop_query(self, exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("slow_query_started"):
+            conn.info["slow_query_started"].pop()
+
+    def should_explain(self, key):
+        now = time.monotonic()
+        with self.lock:
+            if self.explained.get(key, 0) > now:
+                return False
+            self.explained[key] = now + EXPLAIN_INTERVAL
+            return True
+
+    # runs on a second cursor of the same connection; streamed results would
+    # still be pending on the first one, so those are skipped
+    def explain(self, conn, cursor, statement, parameters, context):
+        if not statement.lstrip().upper().startswith("SELECT"):
+            return None
+        if context is not None and context.execution_options.get("stream_results"):
+            return None
+        prefix = "EXPLAIN QUERY PLAN" if conn.dialect.name == "sqlite" else "EXPLAIN"
+        explain_cursor = cursor.connection.cursor()
+        try:
+            explain_cursor.execute(f"{prefix} {statement}", parameters)
+            columns = [column[0] for column in explain_cursor.description]
+            return [dict(zip(columns, row)) for row in explain_cursor.fetchall()]
+        except Exception as e:
+            return [{"error": str(e)}]
+        finally:
+            explain_cursor.close()
+
+
+def read_entries(path):
+    # oldest rotated file first
+    rotated = [p for p in glob.glob(f"{path}.*") if p.rsplit(".", 1)[1].isdigit()]
+    rotated.sort(key=lambda p: -int(p.rsplit(".", 1)[1]))
+    for name in rotated + [path]:
+        try:
+            with open(name, encoding="utf-8") as lines:
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+        except FileNotFoundError:
+            continue
+
+
+# slow queries grouped by fingerprint, worst total time first
+def slow_query_report(path):
+    groups = {}
+    for entry in read_entries(path):
+        group = groups.get(entry["fingerprint"])
+        if group is None:
+            group = groups[entry["fingerprint"]] = {
+                "fingerprint": entry["fingerprint"],
+                "statement": entry["statement"],
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "endpoints": set(),
+                "parameters": entry["parameters"],
+                "explain": None,
+            }
+        group["count"] += 1
+        group["total_ms"] += entry["duration_ms"]
+        group["max_ms"] = max(group["max_ms"], entry["duration_ms"])
+        group["endpoints"].add(entry["endpoint"] or "-")
+        group["explain"] = entry["explain"] or group["explain"]
+    return sorted(groups.values(), key=lambda group: -group["total_ms"])
@@ -0,0 +1,300 @@
+import functools
+import random
+from collections import deque
+from datetime import date, datetime, timedelta
+from extensions import db
+from models import (
+    Member,
+    Spouse,
+    OtherSpouse,
+    Child,
+    MemberSearch,
+    Gender,
+    Status,
+    ChildType,
+    RelationshipType,
+    queue_graph_patch,
+    queue_suggest_patch,
+)
+from search import search_rows, phonetic_key
+
+BATCH_SIZE = 1000
+
+MALE_NAMES = (
+    "adebayo chinedu emeka tunde olumide ifeanyi segun kelechi babatunde obinna "
+    "femi uche kunle nnamdi john david samuel daniel joseph michael peter"
+).split()
+FEMALE_NAMES = (
+    "adaeze funmilayo ngozi yetunde chiamaka bisola amaka temitope nkechi folake "
+    "ifeoma omolara uju kemi mary grace esther ruth sarah elizabeth deborah"
+).split()
+SURNAMES = (
+    "adeyemi okafor balogun nwosu ogunleye eze adebayo okonkwo bakare obi adeleke "
+    "chukwu oyelaran nwachukwu lawal okeke afolabi anyanwu oladipo igwe smith jones"
+).split()
+PLACES = (
+    "Lagos",
+    "Ibadan",
+    "Enugu",
+    "Abeokuta",
+    "Onitsha",
+    "Owerri",
+    "Benin City",
+    "Port Harcourt",
+    "Abuja",
+    "London",
+    "Houston",
+)
+OCCUPATIONS = (
+    "Farmer",
+    "Trader",
+    "Teacher",
+    "Engineer",
+    "Nurse",
+    "Doctor",
+    "Tailor",
+    "Civil servant",
+    "Accountant",
+    "Lawyer",
+    None,
+)
+# who an extra partner is to the husband the family is recorded under
+PARTNER_TYPES = (
+    RelationshipType.wife,
+    RelationshipType.ex_wife,
+    RelationshipType.secondary_wife,
+    RelationshipType.mistress,
+    RelationshipType.partner,
+    RelationshipType.ex_partner,
+)
+CHILD_KINDS = (("birth", 0.86), ("step", 0.07), ("adopted", 0.07))
+CHILD_TYPES = {
+    ("birth", Gender.male): ChildType.son,
+    ("birth", Gender.female): ChildType.daughter,
+    ("step", Gender.male): ChildType.step_son,
+    ("step", Gender.female): ChildType.step_daughter,
+    ("adopted", Gender.male): ChildType.adopted_son,
+    ("adopted", Gender.female): ChildType.adopted_daughter,
+}
+MARRIAGE_RATE = 0.8
+LIFESPAN = 85
+GENERATION_YEARS = 28
+
+# names come from the short lists above
+name_key = functools.lru_cache(maxsize=None)(phonetic_key)
+
+
+class TreeGenerator:
+    """Seeded multi-generation family trees, bulk inserted with the same row
+    shapes create-member and edit-member produce.
+
+    Trees are grown breadth first from a founding couple until they are
+    `depth` generations deep, then a new tree is started, until `members`
+    rows exist (one more if the last founder still needs a wife). Every
+    couple has a Spouse row; with probability `polygamy` the husband gets
+    one or two extra partners as OtherSpouse rows, whose children hang off
+    the same Spouse row with mother_id set to the partner. Only husbands
+    get them: a Spouse row's children take the husband's surname and
+    father, which would be wrong for a wife's other partner. Rows are
+    buffered and flushed parents first, so foreign keys always point at
+    rows that are already inserted.
+    """
+
+    def __init__(
+        self,
+        members,
+        branching=3,
+        polygamy=0.1,
+        depth=5,
+        seed=None,
+        batch_size=BATCH_SIZE,
+    ):
+        self.target = members
+        self.branching = branching
+        self.polygamy = polygamy
+        self.depth = depth
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.created_at = datetime.now() - timedelta(seconds=members)
+        self.buffers = {Member: [], Spouse: [], OtherSpouse: [], Child: []}
+        self.search = []
+        self.report = {
+            "members": 0,
+            "spouses": 0,
+            "other_spouses": 0,
+            "children": 0,
+            "trees": 0,
+        }
+
+    def hex_id(self):
+        return "%032x" % self.random.getrandbits(128)
+
+    def member(self, gender, surname, born):
+        first_name = self.random.choice(
+            MALE_NAMES if gender == Gender.male else FEMALE_NAMES
+        )
+        died = born.year + self.random.randint(LIFESPAN - 30, LIFESPAN + 15)
+        deceased = died < date.today().year
+        self.created_at += timedelta(seconds=1)
+        row = {
+            "id": self.hex_id(),
+            "first_name": first_name,
+            "last_name": surname,
+            "first_name_key": name_key(first_name),
+            "last_name_key": name_key(surname),
+            "gender": gender,
+            "dob": born,
+            "status": Status.deceased if deceased else Status.alive,
+            "deceased_at": datetime(died, 1, 1) if deceased else None,
+            "occupation": self.random.choice(OCCUPATIONS),
+            "birth_place": self.random.choice(PLACES),
+            "birth_name": f"{first_name} {surname}".title(),
+            "created_at": self.created_at,
+        }
+        self.add(Member, row)
+        self.search.extend(search_rows(row["id"], row))
+        return row
+
+    def born_after(self, born, low, high):
+        year = born.year + self.random.randint(low, high)
+        return datetime(year, self.random.randint(1, 12), self.random.randint(1, 28))
+
+    def add(self, model, row):
+        self.buffers[model].append(row)
+        if len(self.buffers[Member]) >= self.batch_size:
+            self.flush()
+
+    # married-in partner of member, with the Spouse row they share
+    def marry(self, member):
+        gender = Gender.female if member["gender"] == Gender.male else Gender.male
+        partner = self.member(
+            gender, self.random.choice(SURNAMES), self.born_after(member["dob"], -5, 5)
+        )
+        husband, wife = (
+            (member, partner) if gender == Gender.female else (partner, member)
+        )
+        family = {
+            "id": self.hex_id(),
+            "husband_id": husband["id"],
+            "wife_id": wife["id"],
+        }
+        self.add(Spouse, family)
+        self.report["spouses"] += 1
+        return family, husband, wife
+
+    # extra partners of the husband, as the (father, mother, mother_id) of
+    # the children they have
+    def other_partners(self, family, husband):
+        if self.random.random() >= self.polygamy:
+            return []
+        parents = []
+        for _ in range(self.random.randint(1, 2)):
+            if self.full():
+                break
+            partner = self.member(
+                Gender.female,
+                self.random.choice(SURNAMES),
+                self.born_after(husband["dob"], -8, 12),
+            )
+            self.add(
+                OtherSpouse,
+                {
+                    "id": self.hex_id(),
+                    "member_id": partner["id"],
+                    "member_related_to": husband["id"],
+                    "relationship_type": self.random.choice(PARTNER_TYPES),
+                    "spouse_id": family["id"],
+                },
+            )
+            self.report["other_spouses"] += 1
+            parents.append((husband, partner, partner["id"]))
+        return parents
+
+    def children(self, family, father, mother, mother_id):
+        kinds = [kind for kind, _ in CHILD_KINDS]
+        weights = [weight for _, weight in CHILD_KINDS]
+        born = []
+        for _ in range(self.random.randint(0, self.branching * 2)):
+            dob = self.born_after(mother["dob"], 18, 40)
+            if self.full() or dob > datetime.now():
+                break
+            gender = self.random.choice((Gender.male, Gender.female))
+            child = self.member(gender, father["last_name"], dob)
+            kind = self.random.choices(kinds, weights)[0]
+            self.add(
+                Child,
+                {
+                    "id": self.hex_id(),
+                    "member_id": child["id"],
+                    "spouse_id": family["id"],
+                    "mother_id": mother_id,
+                    "child_type": CHILD_TYPES[(kind, gender)],
+                },
+            )
+            self.report["children"] += 1
+            born.append(child)
+        return born
+
+    def full(self):
+        return self.report["members"] + len(self.buffers[Member]) >= self.target
+
+    # founders are born early enough for `depth` generations to fit before
+    # today; children of the last generation are not married off
+    def tree(self):
+        first_year = date.today().year - self.depth * GENERATION_YEARS - 20
+        founder = self.member(
+            Gender.male,
+            self.random.choice(SURNAMES),
+            self.born_after(datetime(first_year, 1, 1), 0, 15),
+        )
+        queue = deque([(self.marry(founder), 1)])
+        while queue and not self.full():
+            (family, husband, wife), generation = queue.popleft()
+            if generation >= self.depth:
+                continue
+            parents = [(husband, wife, None)]
+            parents += self.other_partners(family, husband)
+            for father, mother, mother_id in parents:
+                for child in self.children(family, father, mother, mother_id):
+                    if (
+                        generation + 1 < self.depth
+                        and self.random.random() < MARRIAGE_RATE
+                        and not self.full()
+                    ):
+                        queue.append((self.marry(child), generation + 1))
+        self.report["trees"] += 1
+
+    def flush(self):
+        members = self.buffers[Member]
+        self.report["members"] += len(members)
+        for model in (Member, Spouse, OtherSpouse, Child):
+            rows, self.buffers[model] = self.buffers[model], []
+            if rows:
+                db.session.execute(model.__table__.insert(), rows)
+        for i in range(0, len(self.search), self.batch_size * 5):
+            db.session.execute(
+                MemberSearch.__table__.insert(),
+                self.search[i : i + self.batch_size * 5],
+            )
+        self.search = []
+        db.session.commit()
+
+    def run(self):
+        while not self.full():
+            self.tree()
+        self.flush()
+        return self.report
+
+
+# batches are committed as they go; the last commit makes the kinship graph,
+# the suggest index and cached views pick up the new rows
+def generate_tree(members, **options):
+    try:
+        report = TreeGenerator(members, **options).run()
+        queue_graph_patch("reset")
+        queue_suggest_patch("reset")
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return report
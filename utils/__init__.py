@@ -1,5 +1,6 @@
-from flask import jsonify
+from flask import jsonify, request, make_response
 from flask_jwt_extended import create_access_token
+from http_status import HttpStatus
 import random
 import uuid
 import hmac
@@ -8,6 +9,8 @@ import base64
 from io import BytesIO
 import time
 import re
+import json
+import datetime
 
 
 def hex_uuid():
@@ -21,6 +24,19 @@ def return_response(status_code, status=None, message=None, **data):
     return jsonify(res_data), status_code
 
 
+# 304 when the client already holds the representation tagged etag,
+# otherwise the usual response with the ETag attached
+def return_etag_response(etag, status_code, status=None, message=None, **data):
+    if request.if_none_match.contains(etag):
+        response = make_response("", HttpStatus.NOT_MODIFIED)
+    else:
+        response = make_response(
+            return_response(status_code, status=status, message=message, **data)
+        )
+    response.set_etag(etag)
+    return response
+
+
 def return_access_token(identity):
     access_token = create_access_token(identity=identity)
     return access_token
@@ -73,3 +89,27 @@ def extract_public_id(url):
     if match:
         return match.group(1)
     return None
+
+
+# opaque keyset cursor from the sort values of the last row on a page
+def encode_cursor(*values):
+    values = [
+        value.isoformat() if isinstance(value, datetime.datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("utf-8").rstrip("=")
+
+
+def decode_cursor(cursor, size=2):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("utf-8")))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    # cursors only ever hold strings (datetimes as isoformat)
+    if not all(isinstance(value, str) for value in values):
+        return None
+    return values